@@ -0,0 +1,83 @@
+import optparse
+import os
+import tempfile
+import time
+import uuid
+
+import pandas as pd
+
+from modules.ProfileDatabase import DynamicAnalysis, Request, SqlQuery
+from modules.profileUtils import parse_tables_in_query, request_csv_file, sql_queries_csv_file
+
+sample_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'tests', 'SampleProj', 'catalogue')
+
+
+def scale_silk_export(source_path, target_path, scale):
+    requests = pd.read_csv(source_path + request_csv_file)
+    sql_queries = pd.read_csv(source_path + sql_queries_csv_file)
+
+    scaled_requests = []
+    scaled_queries = []
+    for copy in range(scale):
+        new_ids = {request_id: str(uuid.uuid4()) for request_id in requests['id']}
+        request_copy = requests.copy()
+        request_copy['id'] = request_copy['id'].map(new_ids)
+        query_copy = sql_queries.copy()
+        query_copy['id'] = query_copy['id'] + copy * len(sql_queries)
+        query_copy['request_id'] = query_copy['request_id'].map(new_ids)
+        scaled_requests.append(request_copy)
+        scaled_queries.append(query_copy)
+
+    pd.concat(scaled_requests).to_csv(target_path + request_csv_file, index=False)
+    pd.concat(scaled_queries).to_csv(target_path + sql_queries_csv_file, index=False)
+
+
+def analise_queries_per_request(session):
+    # Previous implementation, one SQL_QUERIES lookup per request
+    requests = session.query(Request).filter(Request.view_name.isnot(None)).all()
+    query_analysis = []
+    for request in requests:
+        tables = []
+        for query in session.query(SqlQuery).filter(SqlQuery.request_id.in_([request.id])).all():
+            tables.append(parse_tables_in_query(query.query))
+        query_analysis.append({
+            'path': request.path,
+            'view_name': request.view_name,
+            'tables': [item for sublist in tables for item in sublist['tables']],
+            'type': [query_type['query_type'] for query_type in tables]
+        })
+    return query_analysis
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--scale", action="append", dest="scale", type="int",
+                      help="Number of copies of the sample Silk export (Default: 10, 100, 1000)")
+    (options, args) = parser.parse_args()
+
+    for scale in options.scale or [10, 100, 1000]:
+        with tempfile.TemporaryDirectory() as directory_path:
+            scale_silk_export(sample_path, directory_path, scale)
+            dynamic_analysis = DynamicAnalysis(os.path.join(directory_path, 'bench.db'), directory_path)
+
+            per_request, per_request_time = timed(analise_queries_per_request, dynamic_analysis.session)
+            single_pass, single_pass_time = timed(dynamic_analysis.analise_queries)
+
+            def key(analysis):
+                return sorted((item['path'], item['view_name'], item['tables'], item['type']) for item in analysis)
+
+            assert key(per_request) == key(single_pass)
+            print("scale: {:>5} requests: {:>7} per request: {:8.3f}s single pass: {:8.3f}s speedup: {:6.1f}x".format(
+                scale, len(single_pass), per_request_time, single_pass_time, per_request_time / single_pass_time))
+            dynamic_analysis.session.close()
+            dynamic_analysis.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import multiprocessing
+import optparse
+import os
+import resource
+import tempfile
+import time
+
+from benchmarks.bench_analise_queries import sample_path, scale_silk_export
+from modules.ProfileDatabase import DynamicAnalysis
+from modules.profileUtils import sql_queries_csv_file
+
+
+def import_silk_export(directory_path):
+    start = time.perf_counter()
+    dynamic_analysis = DynamicAnalysis(os.path.join(directory_path, 'bench.db'), directory_path)
+    elapsed = time.perf_counter() - start
+    dynamic_analysis.engine.dispose()
+    # ru_maxrss is reported in kilobytes on linux
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--scale", action="append", dest="scale", type="int",
+                      help="Number of copies of the sample Silk export (Default: 10, 100, 1000)")
+    (options, args) = parser.parse_args()
+
+    # generation and import each run in a fresh interpreter, linux keeps ru_maxrss across fork and exec
+    # so the peak RSS of the parent would otherwise leak into the measurement
+    context = multiprocessing.get_context('spawn')
+    for scale in options.scale or [10, 100, 1000]:
+        with tempfile.TemporaryDirectory() as directory_path:
+            with context.Pool(1) as pool:
+                pool.apply(scale_silk_export, (sample_path, directory_path, scale))
+            csv_size = os.path.getsize(directory_path + sql_queries_csv_file) / (1024 * 1024)
+            with context.Pool(1) as pool:
+                elapsed, peak_rss = pool.apply(import_silk_export, (directory_path,))
+            print("scale: {:>5} silk_sqlquery.csv: {:8.1f}MB import: {:8.3f}s peak RSS: {:8.1f}MB".format(
+                scale, csv_size, elapsed, peak_rss))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import itertools
+import optparse
+import random
+import time
+
+from modules.profileUtils import aggregate_model_usage, build_dynamic_data
+
+
+def generate_query_analysis(number_of_queries, number_of_views=200, number_of_tables=500, seed=0):
+    rng = random.Random(seed)
+    views = ['View{}-list'.format(idx) for idx in range(number_of_views)]
+    tables = ['"APP_TABLE{}"'.format(idx) for idx in range(number_of_tables)]
+    query_types = ['SELECT', 'SELECT', 'SELECT', 'UPDATE', 'INSERT']
+    urls = [{'name': '/api/{}/'.format(view), 'module': 'app.views.{}'.format(view), 'functionCall': view}
+            for view in views]
+
+    query_analysis = []
+    while number_of_queries > 0:
+        queries = min(number_of_queries, rng.randint(1, 20))
+        number_of_queries -= queries
+        query_tables = [rng.sample(tables, rng.randint(1, 3)) for _ in range(queries)]
+        query_analysis.append({
+            'path': '/api/',
+            'view_name': rng.choice(views),
+            'tables': [table for sublist in query_tables for table in sublist],
+            'type': [rng.choice(query_types) for _ in range(queries)]
+        })
+    return query_analysis, urls
+
+
+def calculate_model_usage_per_view(query_analysis, urls):
+    # Previous implementation, every view rescans the whole query_analysis
+    dynamic_data = []
+    view_names = set([view['view_name'] for view in query_analysis])
+    for view_name in view_names:
+        view_tables = [model['tables'] for model in query_analysis if view_name in model['view_name']]
+        view_tables = [item for sublist in view_tables for item in sublist]
+        db_info = []
+        for db_table in [ele for ind, ele in enumerate(view_tables, 1) if ele not in view_tables[ind:]]:
+            model_type = set(list(itertools.chain(*[teste['type'] for teste in query_analysis if
+                                                    any(db_table in table for table in teste['tables'])])))
+            db_info.append({
+                'model': db_table,
+                'usage': view_tables.count(db_table),
+                'model_type': model_type
+            })
+        module_name = list(set([view['module'] for view in urls if view['functionCall'] == view_name]))
+        if len(module_name) == 0:
+            module_name = list(set([view['module'] for view in urls if view['module'] == view_name]))
+        if module_name:
+            dynamic_data.append({
+                'view_name': view_name,
+                'modules': module_name,
+                'main_module': module_name[0],
+                'db_info': db_info
+            })
+    return dynamic_data
+
+
+def indexed_model_usage(query_analysis, urls):
+    view_names, usage, usage_types = aggregate_model_usage(query_analysis)
+    return build_dynamic_data(view_names, usage, usage_types, urls)
+
+
+def normalize(dynamic_data):
+    return sorted((view['view_name'], sorted(view['modules']),
+                   sorted((info['model'], info['usage'], sorted(info['model_type'])) for info in view['db_info']))
+                  for view in dynamic_data)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--queries", action="append", dest="queries", type="int",
+                      help="Number of analysed queries (Default: 1000, 10000, 100000, 1000000)")
+    parser.add_option("--reference-limit", action="store", dest="reference_limit", type="int", default=10000,
+                      help="Largest size the previous implementation is run on (Default: 10000)")
+    (options, args) = parser.parse_args()
+
+    for number_of_queries in options.queries or [1000, 10000, 100000, 1000000]:
+        query_analysis, urls = generate_query_analysis(number_of_queries)
+        indexed, indexed_time = timed(indexed_model_usage, query_analysis, urls)
+        line = "queries: {:>8} indexed: {:8.3f}s".format(number_of_queries, indexed_time)
+        if number_of_queries <= options.reference_limit:
+            per_view, per_view_time = timed(calculate_model_usage_per_view, query_analysis, urls)
+            assert normalize(per_view) == normalize(indexed)
+            line += " per view: {:8.3f}s speedup: {:8.1f}x".format(per_view_time, per_view_time / indexed_time)
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+import contextlib
+import json
+import multiprocessing
+import optparse
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic_project import generate_project
+from modules.Pipeline import STAGES, Pipeline
+from modules.Profiler import Profiler
+
+repository_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+default_results_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'results')
+
+# apps, models, viewsets, queries
+SIZES = ['5,50,25,10000', '20,400,200,100000', '50,2000,1000,1000000']
+
+# dependencies a headless run should only load on the paths that use them
+HEAVY_MODULES = ['matplotlib', 'pandas', 'sqlalchemy', 'scipy', 'networkx']
+import_script = '''
+import json, sys, time
+start = time.perf_counter()
+import monoBreaker
+print(json.dumps([time.perf_counter() - start, [name for name in {} if name in sys.modules]]))
+'''.format(HEAVY_MODULES)
+
+
+def current_revision():
+    try:
+        revision = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=repository_path,
+                                           stderr=subprocess.DEVNULL).decode().strip()
+        changes = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                          cwd=repository_path, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return revision + '-dirty' if changes else revision
+
+
+def measure_imports(repeat=5):
+    # every import runs in a new interpreter, the fastest one is kept
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-W', 'ignore', '-c', import_script], cwd=repository_path)
+        runs.append(json.loads(output.decode().strip().splitlines()[-1]))
+    seconds, modules = min(runs)
+    return {'seconds': seconds, 'modules': modules}
+
+
+def timed_generate(directory_path, size, seed):
+    start = time.perf_counter()
+    project = generate_project(directory_path, *size, seed=seed)
+    return project, time.perf_counter() - start
+
+
+def profile_pipeline(directory_path, algorithm, graph_backend):
+    options = optparse.Values({'graph_backend': graph_backend, 'cache_dir': None, 'jobs': 1, 'silk_db': None,
+                               'rebuild_db': False, 'algorithm': algorithm, 'services': None, 'auto_k': False,
+                               'betweenness_jobs': 1, 'betweenness_samples': None, 'betweenness_seed': 0,
+                               'sweep': False})
+    profiler = Profiler()
+    pipeline = Pipeline(options, directory_path, os.path.join(directory_path, 'bench.db'), profiler=profiler)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        pipeline.run()
+    # ru_maxrss is reported in kilobytes on linux
+    return profiler.to_dict(), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_size(size, seed, algorithm, graph_backend):
+    # generation and every pipeline run use a fresh interpreter, so peak RSS belongs to the pipeline alone
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as directory_path:
+        with context.Pool(1) as pool:
+            project, generate_seconds = pool.apply(timed_generate, (directory_path, size, seed))
+        with context.Pool(1) as pool:
+            profile, peak_rss = pool.apply(profile_pipeline, (directory_path, algorithm, graph_backend))
+    return {
+        'project': project,
+        'generate_seconds': generate_seconds,
+        'peak_rss_mb': peak_rss,
+        'stages': {stage: {key: value for key, value in info.items() if key != 'functions'}
+                   for stage, info in profile['stages'].items()},
+        'counters': profile['counters'],
+    }
+
+
+def size_key(run):
+    project = run['project']
+    return project['apps'], project['models'], project['viewsets'], project['queries']
+
+
+def megabytes(size):
+    # the profiler has no stage peaks before python 3.9
+    return "{:7.1f}MB".format(size / (1024 * 1024)) if size is not None else "      n/a"
+
+
+def print_run(run, previous=None):
+    print("apps: {} models: {} viewsets: {} queries: {} generate: {:.2f}s peak RSS: {:.1f}MB".format(
+        *size_key(run), run['generate_seconds'], run['peak_rss_mb']))
+    # time and traced peak memory of each stage without the stages it reads, peaks start from the heap at stage start
+    for stage in STAGES:
+        info = run['stages'][stage]
+        line = "  {:<8} {:9.3f}s {:>11}".format(stage, info['self_seconds'], megabytes(info['self_peak_memory']))
+        if previous:
+            before = previous['stages'][stage]
+            line += "   was {:9.3f}s {:>11}   time x{:.2f}".format(
+                before['self_seconds'], megabytes(before['self_peak_memory']),
+                info['self_seconds'] / before['self_seconds'] if before['self_seconds'] else float('inf'))
+        print(line)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--size", action="append", dest="sizes",
+                      help="APPS,MODELS,VIEWSETS,QUERIES of a generated project (Default: {})".format(
+                          " ".join(SIZES)))
+    parser.add_option("--seed", action="store", dest="seed", type="int", default=0)
+    parser.add_option("--algorithm", action="store", dest="algorithm", default='louvain',
+                      help="Community detection algorithm of the cuts stage (Default: louvain)")
+    parser.add_option("--graph-backend", action="store", dest="graph_backend", default='networkx')
+    parser.add_option("--results-dir", action="store", dest="results_dir", default=default_results_dir,
+                      help="Directory of the per revision results (Default: benchmarks/results)")
+    parser.add_option("--revision", action="store", dest="revision",
+                      help="Name the results are stored under (Default: the git revision)")
+    parser.add_option("--compare", action="store", dest="compare",
+                      help="Revision whose stored results are shown next to this run")
+    (options, args) = parser.parse_args()
+
+    previous, previous_imports = {}, None
+    if options.compare:
+        with open(os.path.join(options.results_dir, options.compare + '.json')) as results_file:
+            previous_results = json.load(results_file)
+        previous = {size_key(run): run for run in previous_results['runs']}
+        previous_imports = previous_results.get('imports')
+
+    revision = options.revision or current_revision()
+    imports = measure_imports()
+    line = "import monoBreaker: {:.3f}s loads: {}".format(imports['seconds'], ", ".join(imports['modules']) or "none")
+    if previous_imports:
+        line += "   was {:.3f}s loads: {}".format(previous_imports['seconds'],
+                                                ", ".join(previous_imports['modules']) or "none")
+    print(line)
+    runs = []
+    for size in options.sizes or SIZES:
+        run = run_size([int(value) for value in size.split(',')], options.seed, options.algorithm,
+                       options.graph_backend)
+        print_run(run, previous.get(size_key(run)))
+        runs.append(run)
+
+    os.makedirs(options.results_dir, exist_ok=True)
+    results_path = os.path.join(options.results_dir, revision + '.json')
+    with open(results_path, 'w') as results_file:
+        json.dump({
+            'revision': revision,
+            'python': platform.python_version(),
+            'seed': options.seed,
+            'algorithm': options.algorithm,
+            'graph_backend': options.graph_backend,
+            'imports': imports,
+            'runs': runs,
+        }, results_file, indent=2)
+    print("Results stored in {}".format(results_path))
+
+
+if __name__ == '__main__':
+    main()
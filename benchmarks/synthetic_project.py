@@ -0,0 +1,280 @@
+import csv
+import datetime
+import itertools
+import json
+import optparse
+import os
+import random
+import uuid
+
+from modules.profileUtils import request_csv_file, sql_queries_csv_file
+
+APP_NOUNS = ['orders', 'billing', 'catalogue', 'accounts', 'shipping', 'inventory', 'reviews', 'payments',
+             'search', 'notifications', 'support', 'marketing']
+MODEL_NOUNS = ['Order', 'Invoice', 'Customer', 'Product', 'Category', 'Payment', 'Shipment', 'Review', 'Address',
+               'Coupon', 'Stock', 'Supplier', 'Ticket', 'Campaign', 'Warehouse', 'Refund']
+
+REQUEST_COLUMNS = ['id', 'path', 'query_params', 'raw_body', 'body', 'method', 'start_time', 'view_name', 'end_time',
+                   'time_taken', 'encoded_headers', 'meta_time', 'meta_num_queries', 'meta_time_spent_queries',
+                   'pyprofile', 'num_sql_queries', 'prof_file']
+QUERY_COLUMNS = ['id', 'query', 'start_time', 'end_time', 'time_taken', 'traceback', 'request_id']
+
+# share of foreign keys pointing to a model of another app
+cross_app_relations = 0.2
+queries_per_request = 20
+
+
+class SyntheticModel:
+
+    def __init__(self, idx, app):
+        self.name = '{}{}'.format(MODEL_NOUNS[idx % len(MODEL_NOUNS)], idx)
+        self.module = self.name.lower()
+        self.app = app
+        self.db_table = '{}_{}'.format(app, self.module).upper()
+        self.foreign_keys = []
+
+
+class SyntheticViewSet:
+
+    def __init__(self, model, related):
+        self.model = model
+        self.related = related
+        self.name = model.name + 'ViewSet'
+        self.module = '{}.views.{}View.{}'.format(model.app, model.name, self.name)
+        self.route = model.module
+
+
+def build_layout(apps, models, viewsets, rng):
+    if viewsets > models:
+        raise Exception('A synthetic project needs at least one model per viewset')
+    app_names = ['{}{}'.format(APP_NOUNS[idx % len(APP_NOUNS)], idx // len(APP_NOUNS) or '') for idx in range(apps)]
+    model_list = [SyntheticModel(idx, app_names[idx % apps]) for idx in range(models)]
+
+    # foreign keys only point backwards, so the imports between model files stay acyclic
+    models_by_app = {app: [] for app in app_names}
+    for idx, model in enumerate(model_list):
+        app_models = models_by_app[model.app]
+        for _ in range(rng.randint(0, 3)):
+            if rng.random() < cross_app_relations and idx > 0:
+                target = rng.choice(model_list[:idx])
+            elif app_models:
+                target = rng.choice(app_models)
+            else:
+                continue
+            if target not in model.foreign_keys:
+                model.foreign_keys.append(target)
+        app_models.append(model)
+
+    viewset_list = []
+    for idx in range(viewsets):
+        model = model_list[idx * models // viewsets]
+        related = list(model.foreign_keys)
+        related.extend(other for other in rng.sample(models_by_app[model.app], min(2, len(models_by_app[model.app])))
+                       if other is not model and other not in related)
+        viewset_list.append(SyntheticViewSet(model, related))
+    return app_names, model_list, viewset_list
+
+
+def write_file(path, lines):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as source_file:
+        source_file.write('\n'.join(lines) + '\n')
+
+
+def write_sources(path, app_names, model_list, viewset_list):
+    for app in app_names:
+        write_file(os.path.join(path, app, '__init__.py'), [])
+        write_file(os.path.join(path, app, 'helpers', '__init__.py'), [])
+        write_file(os.path.join(path, app, 'helpers', 'HttpResponseHandler.py'), [
+            'from rest_framework.response import Response',
+            '', '',
+            'class HTTP:',
+            '',
+            '    @staticmethod',
+            '    def response(status, message, data=None):',
+            '        return Response({"message": message, "data": data}, status=status)',
+        ])
+        write_file(os.path.join(path, app, 'models', '__init__.py'),
+                   ['from .{} import {}'.format(model.module, model.name) for model in model_list if model.app == app])
+
+    for model in model_list:
+        lines = ['from django.db import models', '']
+        lines.extend('from {}.models.{} import {}'.format(target.app, target.module, target.name)
+                     for target in model.foreign_keys)
+        lines.extend(['', '', 'class {}(models.Model):'.format(model.name),
+                      '    id = models.AutoField(primary_key=True)',
+                      '    name = models.CharField(max_length=256)',
+                      '    created = models.DateTimeField(auto_now_add=True)'])
+        lines.extend('    {} = models.ForeignKey({}, on_delete=models.CASCADE)'.format(target.module, target.name)
+                     for target in model.foreign_keys)
+        lines.extend(['', '    objects = models.Manager()', '',
+                      '    class Meta:',
+                      "        db_table = '{}'".format(model.db_table),
+                      "        ordering = ['-id']"])
+        write_file(os.path.join(path, model.app, 'models', model.module + '.py'), lines)
+
+        write_file(os.path.join(path, model.app, 'serializers', model.module + 'Serializer.py'), [
+            'from rest_framework import serializers',
+            'from ..models.{} import {}'.format(model.module, model.name),
+            '', '',
+            'class {}Serializer(serializers.ModelSerializer):'.format(model.name),
+            '',
+            '    class Meta:',
+            '        model = {}'.format(model.name),
+            "        fields = '__all__'",
+        ])
+
+    for viewset in viewset_list:
+        model = viewset.model
+        lines = ['from rest_framework.viewsets import ModelViewSet', '',
+                 'from {}.helpers.HttpResponseHandler import HTTP'.format(model.app),
+                 'from {}.models.{} import {}'.format(model.app, model.module, model.name),
+                 'from {}.serializers.{}Serializer import {}Serializer'.format(model.app, model.module, model.name)]
+        lines.extend('from {}.models.{} import {}'.format(related.app, related.module, related.name)
+                     for related in viewset.related)
+        lines.extend(['', '', 'class {}(ModelViewSet):'.format(viewset.name), '',
+                      '    def list(self, request):',
+                      '        query = {}.objects.all()'.format(model.name)])
+        lines.extend('        {} = {}.objects.filter(id__in=query)'.format(related.module, related.name)
+                     for related in viewset.related)
+        lines.extend(['        data = {}Serializer(query, many=True).data'.format(model.name),
+                      "        return HTTP.response(200, '{}', data)".format(model.name), '',
+                      '    def retrieve(self, request, pk=None):',
+                      '        instance = {}.objects.get(pk=pk)'.format(model.name),
+                      "        return HTTP.response(200, '{}', {}Serializer(instance).data)".format(
+                          model.name, model.name)])
+        write_file(os.path.join(path, model.app, 'views', model.name + 'View.py'), lines)
+
+    for app in app_names:
+        app_viewsets = [viewset for viewset in viewset_list if viewset.model.app == app]
+        lines = ['from django.urls import path, include', 'from rest_framework.routers import DefaultRouter', '']
+        lines.extend('from {}.views.{}View import {}'.format(app, viewset.model.name, viewset.name)
+                     for viewset in app_viewsets)
+        lines.extend(['', 'router = DefaultRouter()', ''])
+        lines.extend("router.register(r'{}', {}, '{}')".format(viewset.route, viewset.name, viewset.model.name)
+                     for viewset in app_viewsets)
+        lines.extend(['', 'urlpatterns = [', "    path('', include(router.urls))", ']'])
+        write_file(os.path.join(path, app, 'urls.py'), lines)
+
+
+def write_models_file(path, app_names, model_list):
+    graphs = []
+    for app in app_names:
+        graphs.append({
+            'name': '"{}"'.format(app),
+            'app_name': app,
+            'cluster_app_name': 'cluster_' + app,
+            'models': [{
+                'app_name': '{}_models_{}'.format(model.app, model.module),
+                'name': model.name,
+                'abstracts': [],
+                'fields': [{'name': 'id', 'label': 'id', 'type': 'AutoField', 'blank': True, 'abstract': False,
+                            'relation': False, 'primary_key': True}],
+                'relations': [{
+                    'target_app': '{}_models_{}'.format(target.app, target.module),
+                    'target': target.name,
+                    'type': 'ForeignKey',
+                    'name': target.module,
+                    'label': '{} ({})'.format(target.module, model.module),
+                    'arrows': '[arrowhead=none, arrowtail=dot, dir=both]',
+                    'needs_node': False,
+                } for target in model.foreign_keys],
+                'label': model.name,
+            } for model in model_list if model.app == app],
+        })
+    with open(os.path.join(path, 'models.json'), 'w') as models_file:
+        json.dump({'created_at': '2019-07-12 08:28', 'cli_options': '--json', 'disable_fields': False,
+                   'disable_abstract_fields': False, 'use_subgraph': False, 'graphs': graphs}, models_file)
+
+
+def write_urls_file(path, viewset_list):
+    with open(os.path.join(path, 'urls.txt'), 'w') as urls_file:
+        urls_file.write('/api/\trest_framework.routers.APIRootView\tapi-root\n')
+        for viewset in viewset_list:
+            for route, name in (('/', '-list'), ('/<pk>/', '-detail')):
+                urls_file.write('/api/{}{}\t{}\t{}{}\n'.format(viewset.route, route, viewset.module,
+                                                             viewset.model.name, name))
+
+
+def select_query(model, related, rng):
+    table = '"{}"'.format(model.db_table)
+    query = 'SELECT {0}."id", {0}."name", {0}."created" FROM {0}'.format(table)
+    for other in related:
+        query += ' INNER JOIN "{0}" ON ({1}."{2}_id" = "{0}"."id")'.format(other.db_table, table, other.module)
+    return query + ' WHERE {}."id" = {}'.format(table, rng.randint(1, 100000))
+
+
+def write_silk_export(path, viewset_list, queries, rng):
+    # a few viewsets get most of the traffic, as in a real deployment
+    weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(viewset_list))))
+    clock = datetime.datetime(2019, 7, 12, 9, 0, 0)
+    query_id = 0
+    with open(path + request_csv_file, 'w', newline='') as request_file, \
+            open(path + sql_queries_csv_file, 'w', newline='') as query_file:
+        requests = csv.writer(request_file)
+        sql_queries = csv.writer(query_file)
+        requests.writerow(REQUEST_COLUMNS)
+        sql_queries.writerow(QUERY_COLUMNS)
+        while query_id < queries:
+            viewset = rng.choices(viewset_list, cum_weights=weights)[0]
+            detail = rng.random() < 0.3
+            request_id = str(uuid.UUID(int=rng.getrandbits(128)))
+            request_queries = min(queries - query_id, rng.randint(1, 2 * queries_per_request - 1))
+            start_time = clock
+            for _ in range(request_queries):
+                query_id += 1
+                kind = rng.random()
+                if kind < 0.8:
+                    query = select_query(viewset.model, rng.sample(viewset.related, rng.randint(0, len(viewset.related))),
+                                         rng)
+                elif kind < 0.9:
+                    query = 'UPDATE "{}" SET "name" = \'{}\' WHERE "id" = {}'.format(
+                        viewset.model.db_table, rng.getrandbits(32), rng.randint(1, 100000))
+                else:
+                    query = 'INSERT INTO "{}" ("name", "created") VALUES (\'{}\', \'{}\')'.format(
+                        viewset.model.db_table, rng.getrandbits(32), clock)
+                query_end = clock + datetime.timedelta(microseconds=rng.randint(100, 5000))
+                sql_queries.writerow([query_id, query, clock, query_end,
+                                      (query_end - clock).total_seconds() * 1000, '', request_id])
+                clock = query_end
+            route = '/api/{}/{}'.format(viewset.route, '{}/'.format(rng.randint(1, 100000)) if detail else '')
+            requests.writerow([request_id, route, '', '', '', 'GET', start_time,
+                               viewset.model.name + ('-detail' if detail else '-list'), clock,
+                               (clock - start_time).total_seconds() * 1000, '{}', '', '', '', '', request_queries,
+                               ''])
+            clock += datetime.timedelta(milliseconds=rng.randint(1, 500))
+
+
+def generate_project(path, apps=5, models=50, viewsets=25, queries=10000, seed=0):
+    rng = random.Random(seed)
+    app_names, model_list, viewset_list = build_layout(apps, models, viewsets, rng)
+    write_sources(path, app_names, model_list, viewset_list)
+    write_models_file(path, app_names, model_list)
+    write_urls_file(path, viewset_list)
+    write_silk_export(path, viewset_list, queries, rng)
+    return {
+        'apps': apps,
+        'models': models,
+        'viewsets': viewsets,
+        'queries': queries,
+        'relations': sum(len(model.foreign_keys) for model in model_list),
+    }
+
+
+def main():
+    parser = optparse.OptionParser(usage="%prog PATH [options]")
+    parser.add_option("--apps", action="store", dest="apps", type="int", default=5)
+    parser.add_option("--models", action="store", dest="models", type="int", default=50)
+    parser.add_option("--viewsets", action="store", dest="viewsets", type="int", default=25)
+    parser.add_option("--queries", action="store", dest="queries", type="int", default=10000)
+    parser.add_option("--seed", action="store", dest="seed", type="int", default=0)
+    (options, args) = parser.parse_args()
+    if not args:
+        parser.error("missing the directory of the generated project")
+
+    os.makedirs(args[0], exist_ok=True)
+    print(generate_project(args[0], options.apps, options.models, options.viewsets, options.queries, options.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,354 @@
+import hashlib
+import random
+from collections import defaultdict
+
+import numpy as np
+from networkx.algorithms import community
+
+from modules.SparseGraph import SparseGraph, to_networkx
+
+
+def girvan_newman(graph, weight='weight', seed=None, resolution=1, most_valuable_edge=None):
+    # Reference engine, each level removes edges until one more community appears.
+    # Edge betweenness counts hops, networkx would read the usage weights, which measure coupling, as path lengths.
+    return community.girvan_newman(to_networkx(graph), most_valuable_edge=most_valuable_edge)
+
+
+def louvain(graph, weight='weight', seed=None, resolution=1):
+    nodes, adjacency = _index_graph(graph, weight)
+    for membership in _louvain(adjacency, random.Random(seed), resolution, refine=False):
+        yield _communities(nodes, membership)
+
+
+def leiden(graph, weight='weight', seed=None, resolution=1):
+    nodes, adjacency = _index_graph(graph, weight)
+    for membership in _louvain(adjacency, random.Random(seed), resolution, refine=True):
+        yield _communities(nodes, membership)
+
+
+def label_propagation(graph, weight='weight', seed=None, resolution=1):
+    nodes, adjacency = _index_graph(graph, weight)
+    rng = random.Random(seed)
+    labels = list(range(len(nodes)))
+    order = list(range(len(nodes)))
+
+    changed = True
+    while changed:
+        changed = False
+        rng.shuffle(order)
+        for node in order:
+            if not adjacency[node]:
+                continue
+            label_weights = defaultdict(float)
+            for neighbor, edge_weight in adjacency[node].items():
+                if neighbor != node:
+                    label_weights[labels[neighbor]] += edge_weight
+            if not label_weights:
+                continue
+            best_weight = max(label_weights.values())
+            best_labels = [label for label, w in label_weights.items() if w == best_weight]
+            if labels[node] not in best_labels:
+                labels[node] = rng.choice(best_labels)
+                changed = True
+    yield _communities(nodes, labels)
+
+
+# every algorithm yields the levels of its hierarchy, cuts use the default level
+ALGORITHMS = {
+    'girvan_newman': girvan_newman,
+    'louvain': louvain,
+    'leiden': leiden,
+    'label_propagation': label_propagation,
+}
+
+DEFAULT_LEVELS = {
+    'girvan_newman': 1,
+    'louvain': -1,
+    'leiden': -1,
+    'label_propagation': -1,
+}
+
+# divisive levels go from few to many communities, the others merge communities from level to level
+DIVISIVE = {'girvan_newman'}
+
+
+class CommunityHierarchy:
+
+    def __init__(self, levels, default_level=-1, divisive=False):
+        self._levels = iter(levels)
+        self.default_level = default_level
+        self.divisive = divisive
+        self.levels = []
+        self.removed_nodes = set()
+
+    def _next_level(self):
+        try:
+            level = next(self._levels)
+        except StopIteration:
+            return False
+        level = [set(nodes) - self.removed_nodes for nodes in level]
+        self.levels.append([nodes for nodes in level if nodes])
+        return True
+
+    def level(self, depth=None):
+        # levels are computed on demand and kept, depth past the last level returns the last one
+        if depth is None:
+            depth = self.default_level
+        while (depth < 0 or depth >= len(self.levels)) and self._next_level():
+            pass
+        if not self.levels:
+            return []
+        return self.levels[depth] if -len(self.levels) <= depth < len(self.levels) else self.levels[-1]
+
+    def iter_levels(self):
+        depth = 0
+        while depth < len(self.levels) or self._next_level():
+            yield depth, self.levels[depth]
+            depth += 1
+
+    def depth_for(self, count):
+        # the level with the fewest communities that still has at least count, or the one with the most
+        depth = 0
+        for depth, level in self.iter_levels():
+            if self.divisive and len(level) >= count:
+                break
+            if not self.divisive and len(level) < count:
+                return max(depth - 1, 0)
+        return depth
+
+    def best_depth(self, scorer, max_services=None, resolution=1):
+        # one pass over the levels, the highest modularity wins and a lower cut weight breaks ties
+        best_depth, best_score, previous_size = 0, None, None
+        for depth, level in self.iter_levels():
+            if max_services is not None and len(level) > max_services:
+                if previous_size is not None and len(level) >= previous_size:
+                    # divisive hierarchies only grow from here
+                    break
+                previous_size = len(level)
+                continue
+            previous_size = len(level)
+            modularity, cut_weight = scorer.score(level, resolution)
+            if best_score is None or (modularity, -cut_weight) > best_score:
+                best_depth, best_score = depth, (modularity, -cut_weight)
+        return best_depth
+
+    def communities(self, depth=None):
+        return [set(nodes) for nodes in sorted(map(sorted, self.level(depth)))]
+
+    def remove_nodes(self, nodes):
+        self.removed_nodes.update(nodes)
+        self.levels = [[community_nodes - self.removed_nodes for community_nodes in level
+                        if community_nodes - self.removed_nodes] for level in self.levels]
+
+
+def community_hierarchy(graph, algorithm='girvan_newman', weight='weight', seed=None, resolution=1,
+                        most_valuable_edge=None):
+    if algorithm not in ALGORITHMS:
+        raise Exception('Unknown community detection algorithm: {}'.format(algorithm))
+    options = {'most_valuable_edge': most_valuable_edge} if algorithm == 'girvan_newman' else {}
+    levels = ALGORITHMS[algorithm](graph, weight=weight, seed=seed, resolution=resolution, **options)
+    return CommunityHierarchy(levels, DEFAULT_LEVELS[algorithm], algorithm in DIVISIVE)
+
+
+def detect_communities(graph, algorithm='girvan_newman', weight='weight', seed=None, resolution=1):
+    return community_hierarchy(graph, algorithm, weight=weight, seed=seed, resolution=resolution).communities()
+
+
+class PartitionScorer:
+    # Edge arrays are built once, a level is scored from a label array without building subgraphs
+
+    def __init__(self, graph, weight='weight'):
+        self.nodes = list(graph.nodes)
+        self.index = {node: idx for idx, node in enumerate(self.nodes)}
+        if isinstance(graph, SparseGraph):
+            upper = graph.csr().tocoo()
+            upper_mask = upper.row <= upper.col
+            self.origins, self.destinations = upper.row[upper_mask], upper.col[upper_mask]
+            self.weights = upper.data[upper_mask] if weight else np.ones(upper_mask.sum())
+        else:
+            edges = list(graph.edges(data=weight, default=1)) if weight else \
+                [(origin, destination, 1) for origin, destination in graph.edges()]
+            self.origins = np.array([self.index[edge[0]] for edge in edges], dtype=np.int64)
+            self.destinations = np.array([self.index[edge[1]] for edge in edges], dtype=np.int64)
+            self.weights = np.array([edge[2] for edge in edges], dtype=np.float64)
+        self.degrees = np.bincount(self.origins, self.weights, len(self.nodes)) + \
+            np.bincount(self.destinations, self.weights, len(self.nodes))
+        self.total_weight = self.weights.sum()
+
+    def labels(self, communities):
+        labels = np.full(len(self.nodes), -1, dtype=np.int64)
+        for label, nodes in enumerate(communities):
+            labels[[self.index[node] for node in nodes]] = label
+        # nodes outside every community count as singletons
+        unassigned = labels < 0
+        labels[unassigned] = np.arange(unassigned.sum()) + len(communities)
+        return labels
+
+    def score(self, communities, resolution=1):
+        # modularity and the weight of the edges crossing between communities
+        if self.total_weight == 0:
+            return 0.0, 0.0
+        labels = self.labels(communities)
+        internal_weight = self.weights[labels[self.origins] == labels[self.destinations]].sum()
+        community_degrees = np.bincount(labels, self.degrees)
+        modularity = internal_weight / self.total_weight - \
+            resolution * (community_degrees ** 2).sum() / (4.0 * self.total_weight ** 2)
+        return float(modularity), float(self.total_weight - internal_weight)
+
+    def evaluate(self, communities):
+        # standard modularity so runs at different resolutions compare, balance is mean over largest size
+        modularity, cut_weight = self.score(communities)
+        sizes = np.bincount(self.labels(communities))
+        return {
+            'services': len(sizes),
+            'modularity': modularity,
+            'cut_weight': cut_weight,
+            'balance': float(sizes.mean() / sizes.max()) if len(sizes) else 0.0,
+        }
+
+
+def graph_fingerprint(graph, weight='weight'):
+    nodes = sorted(repr(node) for node in graph.nodes)
+    edges = sorted(repr(tuple(sorted((repr(origin), repr(destination)))) + (data.get(weight, 1),))
+                   for origin, destination, data in graph.edges(data=True))
+    fingerprint = hashlib.sha1()
+    for item in nodes + ['--'] + edges:
+        fingerprint.update(item.encode())
+        fingerprint.update(b'\n')
+    return fingerprint.hexdigest()
+
+
+def _index_graph(graph, weight):
+    # Integer indexed adjacency, self loops are kept on the diagonal
+    nodes = list(graph.nodes)
+    if isinstance(graph, SparseGraph):
+        matrix = graph.csr()
+        data = matrix.data.tolist() if weight else [1] * matrix.nnz
+        indices = matrix.indices.tolist()
+        adjacency = [defaultdict(float, zip(indices[start:end], data[start:end]))
+                     for start, end in zip(matrix.indptr[:-1], matrix.indptr[1:])]
+        return nodes, adjacency
+    index = {node: idx for idx, node in enumerate(nodes)}
+    adjacency = [defaultdict(float) for _ in nodes]
+    for origin, destination, data in graph.edges(data=True):
+        edge_weight = data.get(weight, 1) if weight else 1
+        adjacency[index[origin]][index[destination]] += edge_weight
+        if origin != destination:
+            adjacency[index[destination]][index[origin]] += edge_weight
+    return nodes, adjacency
+
+
+def _communities(nodes, membership):
+    communities = defaultdict(set)
+    for node, label in zip(nodes, membership):
+        communities[label].add(node)
+    return list(communities.values())
+
+
+def _louvain(adjacency, rng, resolution, refine):
+    # membership maps every original node to its node in the aggregated graph
+    membership = list(range(len(adjacency)))
+    partition = list(range(len(adjacency)))
+    last_level = None
+
+    while True:
+        partition, moved = _move_nodes(adjacency, partition, rng, resolution)
+        # labels differ between passes, the same partition only compares equal once relabeled
+        level, _ = _relabel([partition[node] for node in membership])
+        if level != last_level:
+            yield level
+            last_level = level
+
+        if refine:
+            aggregate = _refine(adjacency, partition)
+        else:
+            aggregate = partition
+        aggregate, aggregate_count = _relabel(aggregate)
+        if aggregate_count == len(adjacency) and (not moved or not refine):
+            break
+        membership = [aggregate[node] for node in membership]
+
+        parent = [0] * aggregate_count
+        for node, label in enumerate(aggregate):
+            parent[label] = partition[node]
+        adjacency = _aggregate(adjacency, aggregate, aggregate_count)
+        partition, _ = _relabel(parent)
+
+
+def _move_nodes(adjacency, partition, rng, resolution):
+    degrees = [sum(neighbors.values()) + neighbors.get(node, 0) for node, neighbors in enumerate(adjacency)]
+    total_weight = sum(degrees) / 2.0
+    if total_weight == 0:
+        return list(partition), False
+
+    partition = list(partition)
+    community_degree = defaultdict(float)
+    for node, label in enumerate(partition):
+        community_degree[label] += degrees[node]
+
+    order = list(range(len(adjacency)))
+    rng.shuffle(order)
+    moved = False
+    improved = True
+    while improved:
+        improved = False
+        for node in order:
+            current = partition[node]
+            community_degree[current] -= degrees[node]
+
+            links = defaultdict(float)
+            for neighbor, edge_weight in adjacency[node].items():
+                if neighbor != node:
+                    links[partition[neighbor]] += edge_weight
+
+            scale = resolution * degrees[node] / (2.0 * total_weight)
+            best, best_gain = current, links.get(current, 0) - scale * community_degree[current]
+            for label, link_weight in links.items():
+                gain = link_weight - scale * community_degree[label]
+                if gain > best_gain:
+                    best, best_gain = label, gain
+
+            community_degree[best] += degrees[node]
+            if best != current:
+                partition[node] = best
+                improved = moved = True
+    return partition, moved
+
+
+def _refine(adjacency, partition):
+    # Leiden style refinement: split every community into its connected parts
+    refined = [None] * len(adjacency)
+    for start in range(len(adjacency)):
+        if refined[start] is not None:
+            continue
+        refined[start] = start
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for neighbor in adjacency[node]:
+                if refined[neighbor] is None and partition[neighbor] == partition[start]:
+                    refined[neighbor] = start
+                    stack.append(neighbor)
+    return refined
+
+
+def _relabel(labels):
+    mapping = {}
+    relabeled = [mapping.setdefault(label, len(mapping)) for label in labels]
+    return relabeled, len(mapping)
+
+
+def _aggregate(adjacency, aggregate, aggregate_count):
+    aggregated = [defaultdict(float) for _ in range(aggregate_count)]
+    for node, neighbors in enumerate(adjacency):
+        origin = aggregate[node]
+        for neighbor, edge_weight in neighbors.items():
+            destination = aggregate[neighbor]
+            if neighbor == node:
+                aggregated[origin][origin] += edge_weight
+            elif origin == destination:
+                # internal edges are visited from both ends
+                aggregated[origin][origin] += edge_weight / 2.0
+            else:
+                aggregated[origin][destination] += edge_weight
+    return aggregated
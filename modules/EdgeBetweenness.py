@@ -0,0 +1,118 @@
+import multiprocessing
+import pickle
+import random
+
+import networkx as nx
+
+
+def partial_edge_betweenness(graph, sources):
+    # shortest paths starting at sources only, partial sums add up to the full betweenness
+    return nx.edge_betweenness_centrality_subset(graph, sources, list(graph), normalized=False)
+
+
+def betweenness_worker(connection):
+    # every worker keeps its copy of the graph, girvan_newman only sends the edges it removed since the last call
+    graph = None
+    while True:
+        command, payload = pickle.loads(connection.recv_bytes())
+        if command == 'close':
+            break
+        if command == 'graph':
+            graph = payload
+        elif command == 'remove':
+            graph.remove_edges_from(payload)
+        else:
+            try:
+                connection.send(partial_edge_betweenness(graph, payload))
+            except Exception as e:
+                connection.send(e)
+    connection.close()
+
+
+class EdgeBetweenness:
+
+    def __init__(self, processes=1, k=None, seed=None):
+        self.processes = processes
+        self.k = k
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.workers = []
+        self.graph = self.nodes = self.edges = None
+
+    def betweenness(self, graph):
+        sources = list(graph)
+        scale = 1.0
+        if self.k is not None and self.k < len(sources):
+            # approximate mode, the sampled sums are scaled to the whole graph
+            # with a seed the sample only depends on the graph, not on the hierarchies computed before
+            rng = random.Random('{}:{}'.format(self.seed, graph.number_of_edges())) if self.seed is not None \
+                else self.rng
+            sources = rng.sample(sources, self.k)
+            scale = len(graph) / float(self.k)
+
+        if self.processes > 1 and len(sources) > 1:
+            if not self.workers:
+                self._start()
+            self._send_graph(graph)
+            chunks = [sources[idx::self.processes] for idx in range(min(self.processes, len(sources)))]
+            connections = [connection for process, connection in self.workers[:len(chunks)]]
+            for connection, chunk in zip(connections, chunks):
+                connection.send_bytes(pickle.dumps(('betweenness', chunk)))
+            partials = [connection.recv() for connection in connections]
+            for partial in partials:
+                if isinstance(partial, Exception):
+                    raise partial
+        else:
+            partials = [partial_edge_betweenness(graph, sources)]
+
+        betweenness = dict.fromkeys(graph.edges(), 0.0)
+        for partial in partials:
+            for edge, value in partial.items():
+                if edge not in betweenness:
+                    edge = (edge[1], edge[0])
+                betweenness[edge] += value * scale
+        return betweenness
+
+    def _start(self):
+        for _ in range(self.processes):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=betweenness_worker, args=(worker_connection,), daemon=True)
+            process.start()
+            worker_connection.close()
+            self.workers.append((process, connection))
+
+    def _send_graph(self, graph):
+        # the whole graph is only pickled when the workers do not hold it yet, it is pickled once for all of them
+        nodes = set(graph)
+        edges = set(graph.edges())
+        if graph is self.graph and nodes == self.nodes and edges <= self.edges:
+            message = ('remove', list(self.edges - edges))
+        else:
+            message = ('graph', graph)
+        message = pickle.dumps(message)
+        for process, connection in self.workers:
+            connection.send_bytes(message)
+        self.graph, self.nodes, self.edges = graph, nodes, edges
+
+    def __call__(self, graph):
+        # most_valuable_edge for girvan_newman
+        betweenness = self.betweenness(graph)
+        return max(betweenness, key=betweenness.get)
+
+    def close(self):
+        # the workers are started again by the next betweenness call
+        for process, connection in self.workers:
+            try:
+                connection.send_bytes(pickle.dumps(('close', None)))
+            except OSError:
+                process.terminate()
+            process.join()
+            connection.close()
+        self.workers = []
+        self.graph = self.nodes = self.edges = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
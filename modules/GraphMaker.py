@@ -2,9 +2,8 @@ import itertools
 import traceback
 
 import networkx as nx
-from matplotlib import pyplot as plt
-from networkx.algorithms import community
-from networkx.algorithms.community import girvan_newman
+
+from modules.CommunityDetection import community_hierarchy
 
 
 class GraphMaker:
@@ -32,25 +31,16 @@ class GraphMaker:
             graph = self.G
         return (n for n, v in graph.nodes(data=True) if v['type'].lower() == type.lower())
 
-    def split_graph(self, graph_to_split = None, parts=1):
+    def split_graph(self, graph_to_split = None, parts=1, algorithm='girvan_newman'):
         if graph_to_split is None:
             graph_to_split = self.G
 
         multi_graph = []
 
-        comp = girvan_newman(graph_to_split)
-
-        def community_generator(graph):
-            communities_generator = community.girvan_newman(graph)
-
-            top_level_communities = next(communities_generator)
-            next_level_communities = next(communities_generator)
-
-            return next_level_communities # , top_level_communities
-
-        next_level_communities = community_generator(graph_to_split)
+        hierarchy = community_hierarchy(graph_to_split, algorithm)
+        next_level_communities = hierarchy.communities(hierarchy.depth_for(parts) if parts > 1 else None)
 
-        for lvl_comunnity in sorted(map(sorted, next_level_communities)):
+        for lvl_comunnity in map(sorted, next_level_communities):
             community_graph = nx.Graph()
             for node in lvl_comunnity:
                 # for node in nodes:
@@ -72,7 +62,7 @@ class GraphMaker:
             multi_graph.append(community_graph)
 
         k = parts
-        for communities in itertools.islice(comp, k):
+        for communities in itertools.islice((level for _, level in hierarchy.iter_levels()), k):
             community_graph = nx.Graph()
             for names in tuple(sorted(c) for c in communities):
                 for name in names:
@@ -101,6 +91,7 @@ class GraphMaker:
                     print("error: {}".format(str(e)))
 
     def print_graph(self, graph_to_print=None):
+        from matplotlib import pyplot as plt
         if graph_to_print is None:
             graph_to_print = self.G
 
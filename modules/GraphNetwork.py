@@ -1,111 +1,216 @@
-import copy
 import itertools
 
 import networkx as nx
-from matplotlib import pyplot as plt
-from networkx.algorithms import community
+
+from modules.CommunityDetection import DEFAULT_LEVELS, PartitionScorer, community_hierarchy, graph_fingerprint
+from modules.PartitionSweep import SWEEP_SEEDS, sweep_partitions
+from modules.SparseGraph import SparseGraph, to_networkx
+
+BACKENDS = {
+    'networkx': nx.Graph,
+    'sparse': SparseGraph,
+}
+
+
+def view_node_name(module):
+    return module.split(".")[-1]
+
+
+def model_node_name(model):
+    return model.split("_")[-1].replace('"', '').capitalize()
+
+
+def usage_factor(transform_analysis):
+    # usage is scaled by the busiest view-model pair, whatever order the views come in
+    highest_node_usage = max([info['usage'] for view in transform_analysis for info in view['db_info']], default=0)
+    return 1 / highest_node_usage if highest_node_usage > 0 else 1
 
 
 class GraphNetwork:
-    def __init__(self):
-        self.main_graph = nx.Graph()
+    def __init__(self, backend='networkx'):
+        if backend not in BACKENDS:
+            raise Exception('Unknown graph backend: {}'.format(backend))
+        self.backend = backend
+        self.hierarchy_cache = {}
+        self.main_graph = BACKENDS[backend]()
         self.list_of_graph_cuts = []
         self.missing_files = []
+        self.usage_factor = 1
+        self.cut_labels = {}
+        self.dirty_nodes = set()
+
+    @property
+    def main_graph(self):
+        return self._main_graph
+
+    @main_graph.setter
+    def main_graph(self, graph):
+        self._main_graph = graph
+        self.graph_changed()
+
+    def graph_changed(self):
+        # every method changing main_graph calls this: the fingerprint is computed again on the next lookup, the
+        # hierarchies of the previous graph and of its regions are dropped
+        self.fingerprint = None
+        self.hierarchy_cache = {}
+
+    def graph_fingerprint(self, graph=None):
+        if graph is not None and graph is not self.main_graph:
+            return graph_fingerprint(graph)
+        if self.fingerprint is None:
+            self.fingerprint = graph_fingerprint(self.main_graph)
+        return self.fingerprint
 
     def update_static_relations(self, static_relations):
 
         pass
 
     def remove_isolated_nodes(self):
-        self.main_graph.remove_nodes_from(list(nx.isolates(self.main_graph)))
+        isolated_nodes = [node for node, degree in self.main_graph.degree() if degree == 0]
+        if not isolated_nodes:
+            return
+        fingerprint = self.graph_fingerprint()
+        cached = {key: hierarchy for key, hierarchy in self.hierarchy_cache.items() if key[0] == fingerprint}
+
+        self.main_graph.remove_nodes_from(isolated_nodes)
+        self.graph_changed()
+
+        # isolated nodes are singleton communities at every level, the cached hierarchies only lose them
+        fingerprint = self.graph_fingerprint()
+        for key, hierarchy in cached.items():
+            hierarchy.remove_nodes(isolated_nodes)
+            self.hierarchy_cache[(fingerprint,) + key[1:]] = hierarchy
+
+    def community_hierarchy(self, graph=None, algorithm='girvan_newman', seed=None, resolution=1, betweenness=None):
+        if graph is None:
+            graph = self.main_graph
+        # exact betweenness gives the same hierarchy however it is computed, sampled betweenness depends on the seed
+        sampling = (betweenness.k, betweenness.seed) if betweenness and betweenness.k is not None else None
+        key = (self.graph_fingerprint(graph), algorithm, seed, resolution, sampling)
+        if key not in self.hierarchy_cache:
+            self.hierarchy_cache[key] = community_hierarchy(graph, algorithm, seed=seed, resolution=resolution,
+                                                            most_valuable_edge=betweenness)
+        return self.hierarchy_cache[key]
 
     def update(self, transform_analysis):
-        update_graph = self.main_graph
-
-        highest_node_usage = 1
-        # biggest_weight = sorted(update_graph.degree, key=lambda x: x[1], reverse=True)[0][1]
-        view_max_usage = 1
-        for view in transform_analysis:
-            view_max_usage = max([info['usage'] for info in view['db_info']], default=0)
-            highest_node_usage = view_max_usage if highest_node_usage < view_max_usage else highest_node_usage
-
-        factor = view_max_usage / highest_node_usage
+        self.usage_factor = usage_factor(transform_analysis)
+        self.apply_usage(transform_analysis)
 
+    def apply_usage(self, transform_analysis, factor=None):
+        # adds usage counts to the view-model edges in place, the touched nodes are marked dirty
+        if factor is None:
+            factor = self.usage_factor
+        update_graph = self.main_graph
+        model_nodes = {}
         for view in transform_analysis:
-            view_name = view['modules'][0].split(".")[-1]
+            view_name = view_node_name(view['modules'][0])
+            if not update_graph.has_node(view_name):
+                self.dirty_nodes.add(view_name)
             update_graph.add_node(view_name, type='View')
             for info in view['db_info']:
-                if update_graph.has_node(info['model'].split("_")[-1].replace('"', '').capitalize()):
-                    model = info['model'].split("_")[-1].replace('"', '').capitalize()
-
-                    current_edge_weigth = update_graph.get_edge_data(model, view_name, dict({})).get('weight', 1)
-                    weight_to_add = info['usage'] * factor
-                    node_weight = current_edge_weigth + weight_to_add
-                    # node_weight = update_graph[model].get(model, {}).get('weight', 1)
-                    # node_weight = node_weight / highest_node_usage
-                    # node_weight = round((node_weight * added_weight) + 1)
-                    update_graph.add_edge(model, view_name, weight=node_weight)
-
-        self.main_graph = update_graph
-        # return update_graph
+                if info['model'] not in model_nodes:
+                    model_nodes[info['model']] = model_node_name(info['model'])
+                model = model_nodes[info['model']]
+                if update_graph.has_node(model):
+                    current_edge_weigth = update_graph.get_edge_data(model, view_name, {}).get('weight', 1)
+                    update_graph.add_edge(model, view_name, weight=current_edge_weigth + info['usage'] * factor)
+                    self.dirty_nodes.update((model, view_name))
+        self.graph_changed()
+
+    def dirty_cuts(self):
+        return sorted(set(self.cut_labels[node] for node in self.dirty_nodes if node in self.cut_labels))
+
+    def repartition(self, algorithm='girvan_newman', seed=None, resolution=1, betweenness=None):
+        # only the cuts holding dirty nodes, plus nodes added since the last cut, are partitioned again
+        if not self.list_of_graph_cuts:
+            return self.cut_graph(algorithm=algorithm, seed=seed, resolution=resolution, betweenness=betweenness)
+        dirty_cuts = self.dirty_cuts()
+        region = set(node for node in self.main_graph if node not in self.cut_labels)
+        communities = []
+        for idx, graph_cut in enumerate(self.list_of_graph_cuts):
+            nodes = set(node for node in graph_cut.nodes if node in self.main_graph)
+            if idx in dirty_cuts:
+                region.update(nodes)
+            elif nodes:
+                communities.append(nodes)
+
+        if region:
+            hierarchy = self.community_hierarchy(self.main_graph.subgraph(region), algorithm, seed=seed,
+                                                 resolution=resolution, betweenness=betweenness)
+            # hierarchies cut at a fixed depth keep the number of services in the region
+            depth = hierarchy.depth_for(len(dirty_cuts)) if DEFAULT_LEVELS[algorithm] >= 0 else None
+            communities.extend(hierarchy.communities(depth))
+        return self._set_cuts(self.main_graph, [set(nodes) for nodes in sorted(map(sorted, communities))])
+
+    def sweep(self, algorithms=None, resolutions=None, seeds=SWEEP_SEEDS, jobs=1):
+        # the cuts are set to the highest modularity partition, which is always on the pareto front
+        results = sweep_partitions(self.main_graph, algorithms, resolutions, seeds, jobs)
+        if results:
+            self._set_cuts(self.main_graph, [set(nodes) for nodes in results[0]['communities']])
+        return results
 
     def add_node_list(self, node_list):
-        for node in node_list:
-            self.main_graph.add_node(node.name)
+        self.main_graph.add_nodes_from(node.name for node in node_list)
+        self.graph_changed()
 
     def add_edge_list(self, relation_list):
-        for relation in relation_list:
-            self.main_graph.add_edge(relation.origin.name, relation.destination.name, weight=relation.weight)
+        self.main_graph.add_edges_from((relation.origin.name, relation.destination.name, {'weight': relation.weight})
+                                       for relation in relation_list)
+        self.graph_changed()
 
     def show_graph(self, graph=None, labels=True):
+        from matplotlib import pyplot as plt
         if graph is None:
-            graph = copy.deepcopy(self.main_graph)
+            graph = self.main_graph
+        graph = to_networkx(graph)
         nx.spring_layout(graph,k=0.15,iterations=20)
         nx.draw_networkx(graph, with_labels=labels)
         plt.show()
 
-    def cut_graph(self, graph_to_cut: nx.Graph = None):
+    def cut_graph(self, graph_to_cut: nx.Graph = None, algorithm='girvan_newman', seed=None, resolution=1,
+                  depth=None, betweenness=None, services=None, auto_k=False):
         if graph_to_cut is None:
-            graph_to_cut = copy.deepcopy(self.main_graph)
-
-        communities_generator = community.girvan_newman(graph_to_cut)
-
-        top_level_communities = next(communities_generator)
-        try:
-            next_level_communities = next(communities_generator)
-        except StopIteration:
-            next_level_communities=top_level_communities
-
-        list_of_missing_files = []
-
-        self.list_of_graph_cuts = []
-        for lvl_comunnity in sorted(map(sorted, next_level_communities)):
-            new_cut = nx.Graph()
+            graph_to_cut = self.main_graph
+
+        hierarchy = self.community_hierarchy(graph_to_cut, algorithm, seed=seed, resolution=resolution,
+                                             betweenness=betweenness)
+        if depth is None and auto_k:
+            # services bounds the search when both are given
+            depth = hierarchy.best_depth(PartitionScorer(graph_to_cut), max_services=services, resolution=resolution)
+        elif depth is None and services:
+            depth = hierarchy.depth_for(services)
+        return self._set_cuts(graph_to_cut, hierarchy.communities(depth))
+
+    def set_cuts(self, communities):
+        return self._set_cuts(self.main_graph, [set(nodes) for nodes in communities])
+
+    def _set_cuts(self, graph_to_cut, next_level_communities):
+        # cuts are read only views over graph_to_cut, nothing is copied
+        cut_labels = {}
+        for idx, lvl_comunnity in enumerate(next_level_communities):
             for node in lvl_comunnity:
-                new_cut.add_node(node)
-            self.list_of_graph_cuts.append(new_cut)
-
-        for cut in self.list_of_graph_cuts:
-            missing_files = []
-            for node in cut.nodes:
-                relations = [relation for relation in graph_to_cut.edges(node)]
-                # relation = list(sum(relation, ()))
-                for relation in relations:
-                    if cut.has_node(relation[0]) and cut.has_node(relation[1]):
-                        relation_weight = graph_to_cut[relation[0]][relation[1]].get('weight', 0)
-                        cut.add_edge(relation[1], relation[0], weigth=relation_weight)
-                    else:
-                        # print("Missing: {}".format(relation[1] if cut.has_node(relation[0]) else relation[0]))
-                        missing_files.append({
-                            'file': relation[1] if cut.has_node(relation[0]) else relation[0]
+                cut_labels[node] = idx
+        self.list_of_graph_cuts = [graph_to_cut.subgraph(lvl_comunnity) for lvl_comunnity in next_level_communities]
+        self.cut_labels = cut_labels
+        self.dirty_nodes = set()
+
+        # boundary edges in a single pass over the adjacency
+        list_of_missing_files = [[] for _ in next_level_communities]
+        for idx, lvl_comunnity in enumerate(next_level_communities):
+            for node in sorted(lvl_comunnity):
+                for neighbor in graph_to_cut[node]:
+                    if cut_labels[neighbor] != idx:
+                        list_of_missing_files[idx].append({
+                            'file': neighbor
                         })
-            list_of_missing_files.append(missing_files)
         self.missing_files = list_of_missing_files
         return self.list_of_graph_cuts
 
     def print_graph(self, graph_to_print=None):
+        from matplotlib import pyplot as plt
         if graph_to_print is None:
             graph_to_print = self.main_graph
+        graph_to_print = to_networkx(graph_to_print)
 
         groups = set(nx.get_node_attributes(graph_to_print, 'type').values())
 
@@ -1,73 +1,105 @@
 import json
 import os
+import re
 
 import networkx as nx
-from matplotlib import pyplot as plt
 
 from modules.GraphNetwork import GraphNetwork
+from modules.SparseGraph import to_networkx
+
+model_file_chunk_size = 1 << 16
+_whitespace = re.compile(r'\s*')
 
 
 class ModelParser:
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, backend='networkx'):
         self.file_path = file_path + '/models.json'
         self.entities_list = []
+        self.entity_index = {}
+        self.interned_entities = {}
         self.relations_list = []
-        self.graph_network = GraphNetwork()
+        self.backend = backend
+        self.graph_network = GraphNetwork(backend)
 
     def update_static_relations(self, static_relations):
+        view_entities = []
+        new_relations = []
         for view in static_relations:
             for model in static_relations[view]:
-                e = list(map(lambda x: x['name'] == model['name'], [e.to_json() for e in self.entities_list]))
-                t = [i for i, x in enumerate(e) if x]
-                view_entity = Entity(app_name=view, name=view)
-                if t:
-                    new_relation = Relation(origin=view_entity, destination=self.entities_list[t[0]], weight=model['usage'])
-                    self.graph_network.add_node_list([view_entity])
-                    self.graph_network.add_edge_list([new_relation])
-                    self.entities_list.append(view_entity)
-                    self.relations_list.append(new_relation)
+                model_entity = self.entity_index.get(model['name'])
+                if model_entity is not None:
+                    view_entity = self.entity(view, view)
+                    new_relation = Relation(origin=view_entity, destination=model_entity, weight=model['usage'])
+                    self._add_entity(view_entity)
+                    view_entities.append(view_entity)
+                    new_relations.append(new_relation)
+        self.graph_network.add_node_list(view_entities)
+        self.graph_network.add_edge_list(new_relations)
+        self.relations_list.extend(new_relations)
+
+    def entity(self, app_name, name):
+        # one Entity per (app_name, name), relations point at the shared instance
+        key = (app_name, name)
+        entity = self.interned_entities.get(key)
+        if entity is None:
+            entity = self.interned_entities[key] = Entity(app_name, name)
+        return entity
+
+    def _add_entity(self, entity):
+        # the first entity with a name is the one relations resolve to
+        self.entities_list.append(entity)
+        self.entity_index.setdefault(str(entity.name), entity)
 
     def read_model_file(self):
         if os.path.isfile(self.file_path):
-            with open(self.file_path) as data_file:
-                data = json.load(data_file)
-
             self.entities_list = []
+            self.entity_index = {}
+            self.interned_entities = {}
             self.relations_list = []
-            for graphs in data['graphs']:
-                for models in graphs['models']:
-                    new_entity = Entity(models['app_name'], models['name'])
-                    self.entities_list.append(new_entity)
+            # the graph is built while the file is read, the edges follow once every model node is in
+            self.graph_network = GraphNetwork(self.backend)
+            with open(self.file_path) as data_file:
+                for models in iter_models(data_file):
+                    new_entity = self.entity(models['app_name'], models['name'])
+                    self._add_entity(new_entity)
+                    self.graph_network.add_node_list([new_entity])
                     for relation in models['relations']:
-                        target_destination = Entity(relation.get('target_app', ''), relation.get('target', ''))
+                        target_destination = self.entity(relation['target_app'], relation['target'])
                         new_relation = Relation(new_entity, target_destination)
                         self.relations_list.append(new_relation)
+            self.graph_network.add_edge_list(self.relations_list)
         else:
             raise Exception('Unable to Locate models.json file')
 
     def create_graph(self):
-        self.graph_network = GraphNetwork()
+        self.graph_network = GraphNetwork(self.backend)
         self.graph_network.add_node_list(self.entities_list)
         self.graph_network.add_edge_list(self.relations_list)
         # self.graph.show_graph()
 
-    def cut_graph(self):
-        self.graph_network.cut_graph()
+    def cut_graph(self, algorithm='girvan_newman', seed=None, resolution=1, betweenness=None, services=None,
+                  auto_k=False):
+        self.graph_network.cut_graph(algorithm=algorithm, seed=seed, resolution=resolution, betweenness=betweenness,
+                                     services=services, auto_k=auto_k)
 
     def show_graph(self, labels=False, savefig=False):
-        pos = nx.spring_layout(self.graph_network.main_graph)
+        from matplotlib import pyplot as plt
+        main_graph = to_networkx(self.graph_network.main_graph)
+        pos = nx.spring_layout(main_graph)
         if labels:
-            nx.draw_networkx_labels(self.graph_network.main_graph, pos=pos, font_size=10)
-            nx.draw_networkx(self.graph_network.main_graph, with_labels=labels)
+            nx.draw_networkx_labels(main_graph, pos=pos, font_size=10)
+            nx.draw_networkx(main_graph, with_labels=labels)
         else:
-            nx.draw_networkx(self.graph_network.main_graph, with_labels=False)
+            nx.draw_networkx(main_graph, with_labels=False)
         if savefig:
             plt.savefig("Graph.png", format="PNG")
         plt.show()
 
     def save_graph_cuts(self):
+        from matplotlib import pyplot as plt
         for idx, graph_cut in enumerate(self.graph_network.list_of_graph_cuts):
+            graph_cut = to_networkx(graph_cut)
             pos = nx.spring_layout(graph_cut, k=0.25, iterations=50)
             nx.draw_networkx_labels(graph_cut, pos=pos, font_size=10)
             nx.draw_networkx(graph_cut, with_labels=True)
@@ -80,15 +112,116 @@ class ModelParser:
 
     def create_cuts_gelphi(self):
         for idx, graph in enumerate(self.graph_network.list_of_graph_cuts):
-            nx.write_gexf(graph, "output/graph_{}.gexf".format(idx))
+            nx.write_gexf(to_networkx(graph), "output/graph_{}.gexf".format(idx))
             self.graph_network.show_graph(graph)
-        nx.write_gexf(self.graph_network.main_graph, "output/graph_main.gexf")
+        nx.write_gexf(to_networkx(self.graph_network.main_graph), "output/graph_main.gexf")
 
     def create_main_graph_gephi(self):
-        nx.write_gexf(self.graph_network.main_graph, "output/graph_main.gexf")
+        nx.write_gexf(to_networkx(self.graph_network.main_graph), "output/graph_main.gexf")
+
+
+class JsonStream:
+    # reads JSON values from a file one at a time, only the value being decoded is kept in memory
+
+    def __init__(self, data_file, chunk_size=model_file_chunk_size):
+        self.data_file = data_file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        # reads grow with the pending text so a large value is retried a logarithmic number of times
+        chunk = self.data_file.read(max(self.chunk_size, len(self.buffer) - self.position))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        while True:
+            self.position = _whitespace.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill():
+                raise Exception('Unexpected end of models.json')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise Exception('Malformed models.json, expected {}'.format(char))
+        self.position += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except ValueError:
+                if self._fill():
+                    continue
+                raise
+            # a number can continue in the next chunk
+            if end == len(self.buffer) and not self.eof and self._fill():
+                continue
+            self.position = end
+            return value
+
+    def keys(self):
+        # the caller reads or skips the value of every key before asking for the next one
+        self.expect('{')
+        if self.peek() == '}':
+            self.position += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.peek() != ',':
+                self.expect('}')
+                return
+            self.position += 1
+
+    def items(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+        while True:
+            yield
+            if self.peek() != ',':
+                self.expect(']')
+                return
+            self.position += 1
+
+
+def iter_models(data_file, chunk_size=model_file_chunk_size):
+    # graph_models --json output, only app_name, name and relation targets are kept from every model
+    stream = JsonStream(data_file, chunk_size)
+    for key in stream.keys():
+        if key != 'graphs':
+            stream.value()
+            continue
+        for _ in stream.items():
+            for graph_key in stream.keys():
+                if graph_key != 'models':
+                    stream.value()
+                    continue
+                for _ in stream.items():
+                    model = stream.value()
+                    yield {
+                        'app_name': model['app_name'],
+                        'name': model['name'],
+                        'relations': [{'target_app': relation.get('target_app', ''),
+                                       'target': relation.get('target', '')} for relation in model['relations']]
+                    }
 
 
 class Entity:
+    __slots__ = ('app_name', 'name')
+
     def __init__(self, app_name, name):
         self.app_name = app_name
         self.name = name
@@ -104,6 +237,8 @@ class Entity:
 
 
 class Relation:
+    __slots__ = ('origin', 'destination', 'r_type', 'weight')
+
     def __init__(self, origin: Entity, destination: Entity, weight=1):
         self.origin = origin
         self.destination = destination
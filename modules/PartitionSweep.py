@@ -0,0 +1,70 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+from modules.CommunityDetection import PartitionScorer, community_hierarchy
+
+SWEEP_ALGORITHMS = ['louvain', 'leiden', 'label_propagation']
+SWEEP_RESOLUTIONS = [0.5, 1, 2]
+SWEEP_SEEDS = 5
+
+# algorithms that ignore the seed or the resolution run once for those values
+DETERMINISTIC = {'girvan_newman'}
+IGNORES_RESOLUTION = {'girvan_newman', 'label_propagation'}
+
+_worker_graph = None
+
+
+def _init_worker(graph):
+    # the graph is sent once per worker instead of once per run
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _run_partition(run):
+    algorithm, seed, resolution = run
+    communities = community_hierarchy(_worker_graph, algorithm, seed=seed, resolution=resolution).communities()
+    return [sorted(nodes) for nodes in communities]
+
+
+def sweep_grid(algorithms=None, resolutions=None, seeds=SWEEP_SEEDS):
+    grid = []
+    for algorithm in algorithms or SWEEP_ALGORITHMS:
+        algorithm_seeds = [None] if algorithm in DETERMINISTIC else range(seeds)
+        algorithm_resolutions = [1] if algorithm in IGNORES_RESOLUTION else resolutions or SWEEP_RESOLUTIONS
+        grid.extend(itertools.product([algorithm], algorithm_seeds, algorithm_resolutions))
+    return grid
+
+
+def pareto_front(results):
+    # higher modularity, lower cut weight and higher balance are better
+    def dominates(first, second):
+        first_key = (first['modularity'], -first['cut_weight'], first['balance'])
+        second_key = (second['modularity'], -second['cut_weight'], second['balance'])
+        return all(a >= b for a, b in zip(first_key, second_key)) and first_key != second_key
+
+    return [result for result in results if not any(dominates(other, result) for other in results)]
+
+
+def sweep_partitions(graph, algorithms=None, resolutions=None, seeds=SWEEP_SEEDS, jobs=1):
+    grid = sweep_grid(algorithms, resolutions, seeds)
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(graph,)) as executor:
+            partitions = list(executor.map(_run_partition, grid))
+    else:
+        _init_worker(graph)
+        partitions = [_run_partition(run) for run in grid]
+
+    # runs that agree are merged, the number of runs behind a partition shows how stable it is
+    scorer = PartitionScorer(graph)
+    results = {}
+    for (algorithm, seed, resolution), communities in zip(grid, partitions):
+        key = tuple(tuple(nodes) for nodes in communities)
+        if key not in results:
+            results[key] = dict(scorer.evaluate(communities), communities=communities, runs=[])
+        results[key]['runs'].append({'algorithm': algorithm, 'seed': seed, 'resolution': resolution})
+
+    results = sorted(results.values(), key=lambda result: (-result['modularity'], result['cut_weight']))
+    front = pareto_front(results)
+    for result in results:
+        result['pareto'] = any(result is best for best in front)
+    return results
@@ -0,0 +1,273 @@
+import copy
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+from fnmatch import fnmatch
+
+from modules.EdgeBetweenness import EdgeBetweenness
+from modules.ModelParser import ModelParser
+from modules.Profiler import Profiler
+from modules.StaticAnalysis import StaticAnalysis, analyser_version
+from modules.profileUtils import query_cache_info, request_csv_file, resolve_models, sql_queries_csv_file
+
+# bump when a stage produces a different artifact for the same inputs
+pipeline_version = 6
+
+# stage -> stages it reads, a stage is recomputed when its own inputs or any upstream key change
+STAGES = OrderedDict([
+    ('models', []),
+    ('static', []),
+    ('dynamic', ['static']),
+    ('graph', ['models', 'static', 'dynamic']),
+    ('cuts', ['graph']),
+    ('report', ['static', 'cuts']),
+])
+
+
+def file_fingerprint(file_paths):
+    fingerprint = []
+    for file_path in file_paths:
+        if os.path.isfile(file_path):
+            stat = os.stat(file_path)
+            fingerprint.append((os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns))
+        else:
+            fingerprint.append((os.path.abspath(file_path), None, None))
+    return fingerprint
+
+
+def tree_fingerprint(directory_path, file_pattern):
+    file_paths = []
+    for path, subdirs, files in os.walk(directory_path):
+        subdirs.sort()
+        file_paths.extend(os.path.join(path, name) for name in sorted(files) if fnmatch(name, file_pattern))
+    return file_fingerprint(file_paths)
+
+
+def stage_key(stage, inputs):
+    return hashlib.sha1(repr((pipeline_version, stage, inputs)).encode()).hexdigest()
+
+
+def graph_model_names(graph_network):
+    return set(str(node).lower() for node in graph_network.main_graph.nodes)
+
+
+class ArtifactCache:
+    # one pickle per stage, holding the key it was built from
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _artifact_path(self, stage):
+        return os.path.join(self.cache_dir, stage + '.pickle')
+
+    def get(self, stage, key):
+        try:
+            with open(self._artifact_path(stage), 'rb') as artifact_file:
+                artifact_key, artifact = pickle.load(artifact_file)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return False, None
+        return artifact_key == key, artifact
+
+    def put(self, stage, key, artifact):
+        temp_path = self._artifact_path(stage) + '.tmp'
+        with open(temp_path, 'wb') as artifact_file:
+            pickle.dump((key, artifact), artifact_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self._artifact_path(stage))
+
+
+class Pipeline:
+
+    def __init__(self, options, directory_path, db_name, artifact_dir=None, profiler=None):
+        self.options = options
+        self.profiler = profiler or Profiler(enabled=False)
+        self.directory_path = directory_path
+        self.db_name = db_name
+        self.artifacts = ArtifactCache(artifact_dir) if artifact_dir else None
+        # the Silk data cannot be fingerprinted when the database is rebuilt, it is always imported again
+        self.forced = {'dynamic'} if options.rebuild_db else set()
+        self.keys = {}
+        self.results = {}
+        self.computed = []
+        self.reused = []
+        self.betweenness = None
+        if options.betweenness_jobs > 1 or options.betweenness_samples:
+            self.betweenness = EdgeBetweenness(processes=options.betweenness_jobs, k=options.betweenness_samples,
+                                               seed=options.betweenness_seed)
+
+    def key(self, stage):
+        if stage not in self.keys:
+            inputs = [self.key(upstream) for upstream in STAGES[stage]] + getattr(self, '_inputs_' + stage)()
+            self.keys[stage] = stage_key(stage, inputs)
+        return self.keys[stage]
+
+    def is_forced(self, stage):
+        return stage in self.forced or any(self.is_forced(upstream) for upstream in STAGES[stage])
+
+    def get(self, stage):
+        if stage not in self.results:
+            with self.profiler.stage(stage):
+                hit, artifact = False, None
+                if self.artifacts and not self.is_forced(stage):
+                    hit, artifact = self.artifacts.get(stage, self.key(stage))
+                if hit:
+                    self.reused.append(stage)
+                else:
+                    artifact = getattr(self, '_build_' + stage)()
+                    self.computed.append(stage)
+                    if self.artifacts:
+                        self.artifacts.put(stage, self.key(stage), artifact)
+            self.profiler.annotate(stage, cached=hit)
+            self.results[stage] = artifact
+        return self.results[stage]
+
+    def close(self):
+        if self.betweenness is not None:
+            self.betweenness.close()
+
+    def run(self):
+        # stages are only loaded or built when a stage downstream of them has to be rebuilt
+        return self.get('report')
+
+    def model_parser(self):
+        return self.get('graph')['model_parser']
+
+    def static_analysis(self):
+        return self.get('static')
+
+    def transform_analysis(self):
+        return self.get('graph')['transform_analysis']
+
+    def cuts(self):
+        cuts = self.get('cuts')
+        graph_network = self.model_parser().graph_network
+        if not graph_network.list_of_graph_cuts:
+            graph_network.set_cuts(cuts['communities'])
+        return cuts
+
+    def _inputs_models(self):
+        return [file_fingerprint([os.path.join(self.directory_path, 'models.json')]), self.options.graph_backend]
+
+    def _build_models(self):
+        model_analizer = ModelParser(self.directory_path, backend=self.options.graph_backend)
+        model_analizer.read_model_file()
+        self.profiler.set('models.entities', len(model_analizer.entities_list))
+        self.profiler.set('models.relations', len(model_analizer.relations_list))
+        return model_analizer
+
+    def _inputs_static(self):
+        return [tree_fingerprint(self.directory_path, '*.py'),
+                file_fingerprint([os.path.join(self.directory_path, 'urls.txt')]), analyser_version]
+
+    def _build_static(self):
+        print("Starting Static Analysis")
+        static_analisys = StaticAnalysis(cache_dir=self.options.cache_dir)
+        static_analisys.analyze_django_project(self.directory_path, jobs=self.options.jobs)
+        static_analisys.parse_url_file()
+        self.profiler.set('static.files_parsed', len(static_analisys.project_analysis))
+        if static_analisys.cache:
+            self.profiler.set('static.ast_cache_hits', static_analisys.cache.hits)
+            self.profiler.set('static.ast_cache_misses', static_analisys.cache.misses)
+        return static_analisys
+
+    def _inputs_dynamic(self):
+        if self.options.silk_db:
+            # a live Silk database is read in place, it is summarised by its newest rows
+            return [os.path.abspath(self.db_name), self.options.silk_db, self._silk_watermarks()]
+        return [os.path.abspath(self.db_name), file_fingerprint([self.directory_path + request_csv_file, self.directory_path + sql_queries_csv_file])]
+
+    def _silk_watermarks(self):
+        # SQLAlchemy and the Silk models are only loaded when the dynamic stage has to be checked or built
+        import sqlalchemy as db
+        from modules.ProfileDatabase import SilkRequest, SilkSqlQuery
+        engine = db.create_engine(self.options.silk_db)
+        try:
+            with engine.connect() as conn:
+                return [tuple(conn.execute(db.select([db.func.max(SilkRequest.start_time),
+                                                      db.func.count(SilkRequest.id)])).first()),
+                        tuple(conn.execute(db.select([db.func.max(SilkSqlQuery.id),
+                                                      db.func.count(SilkSqlQuery.id)])).first())]
+        finally:
+            engine.dispose()
+
+    def _build_dynamic(self):
+        from modules.ProfileDatabase import DynamicAnalysis
+        print("Starting Dynamic Analysis")
+        # the query cache lives as long as the process, only the lookups of this stage are counted
+        query_cache_before = query_cache_info()
+        dynamic_analysis = DynamicAnalysis(self.db_name, self.directory_path, rebuild=self.options.rebuild_db,
+                                           silk_db=self.options.silk_db)
+        usage = dynamic_analysis.calculate_model_usage(self.static_analysis().urls)
+        dynamic_analysis.engine.dispose()
+        query_cache = query_cache_info()
+        hits = query_cache['hits'] - query_cache_before['hits']
+        misses = query_cache['misses'] - query_cache_before['misses']
+        self.profiler.set('dynamic.requests_analysed', len(dynamic_analysis.query_analysis))
+        self.profiler.set('dynamic.queries_parsed', hits + misses)
+        self.profiler.set('dynamic.query_cache_hits', hits)
+        self.profiler.set('dynamic.query_cache_misses', misses)
+        return usage
+
+    def _inputs_graph(self):
+        return []
+
+    def _build_graph(self):
+        # the graph is built on a copy, the models result stays what the models stage produced
+        model_analizer = copy.deepcopy(self.get('models'))
+        static_analisys = self.static_analysis()
+        model_analizer.update_static_relations(static_analisys.create_static_relations())
+        transform_analysis = resolve_models(self.get('dynamic'), static_analisys.table_models,
+                                            graph_model_names(model_analizer.graph_network))
+        model_analizer.graph_network.update(transform_analysis)
+        main_graph = model_analizer.graph_network.main_graph
+        self.profiler.set('graph.nodes', main_graph.number_of_nodes())
+        self.profiler.set('graph.edges', main_graph.number_of_edges())
+        return {'model_parser': model_analizer, 'transform_analysis': transform_analysis}
+
+    def _inputs_cuts(self):
+        options = self.options
+        sweep = (options.sweep_algorithms, options.sweep_resolutions, options.sweep_seeds) if options.sweep else None
+        sampling = (options.betweenness_samples, options.betweenness_seed) if options.betweenness_samples else None
+        return [options.algorithm, options.services, options.auto_k, sampling, sweep]
+
+    def _build_cuts(self):
+        options = self.options
+        graph_network = self.model_parser().graph_network
+        sweep_results = None
+        if options.sweep:
+            sweep_results = graph_network.sweep(options.sweep_algorithms.split(","),
+                                                [float(value) for value in options.sweep_resolutions.split(",")],
+                                                options.sweep_seeds, options.jobs)
+        else:
+            try:
+                graph_network.cut_graph(algorithm=options.algorithm, betweenness=self.betweenness,
+                                        services=options.services, auto_k=options.auto_k)
+            finally:
+                # the betweenness worker processes are not kept alive once the graph is cut
+                self.close()
+        self.profiler.set('cuts.services', len(graph_network.list_of_graph_cuts))
+        return {
+            'communities': [sorted(graph_cut.nodes) for graph_cut in graph_network.list_of_graph_cuts],
+            'sweep': sweep_results,
+        }
+
+    def _inputs_report(self):
+        return []
+
+    def _build_report(self):
+        self.cuts()
+        static_analisys = self.static_analysis()
+        final_changes = static_analisys.create_report(self.model_parser().graph_network, self.transform_analysis())
+        project_analysis = static_analisys.project_analysis
+        return {
+            'files': len(project_analysis),
+            'django_views': len([names for names in project_analysis if len(names['django_views']) > 0]),
+            'django_models': len([names for names in project_analysis if len(names['django_models']) > 0]),
+            'services': self.get('cuts')['communities'],
+            'changes': [{
+                'graph_number': changes['graph_number'],
+                'list_of_files': [str(file) for file in changes['list_of_files']],
+                'instructions': changes['instructions'],
+            } for changes in final_changes],
+        }
@@ -0,0 +1,310 @@
+import itertools
+from collections import Counter
+
+import sqlalchemy as db
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from modules.profileUtils import aggregate_model_usage, build_dynamic_data, parse_tables_in_query, \
+    request_csv_file, resolve_models, sql_queries_csv_file
+
+Base = declarative_base()
+SilkBase = declarative_base()
+
+request_table_name = 'REQUEST'
+sql_queries_table_name = 'SQL_QUERIES'
+ingest_state_table_name = 'INGEST_STATE'
+view_usage_table_name = 'VIEW_USAGE'
+model_usage_table_name = 'MODEL_USAGE'
+model_usage_type_table_name = 'MODEL_USAGE_TYPE'
+silk_request_table_name = 'silk_request'
+silk_sql_queries_table_name = 'silk_sqlquery'
+
+csv_chunk_size = 1000
+sqlite_pragmas = [
+    'PRAGMA synchronous = OFF',
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -16384',
+]
+
+
+class Request(Base):
+    __tablename__ = request_table_name
+
+    id = db.Column(db.String, primary_key=True)
+    path = db.Column(db.String)
+    query_params = db.Column(db.String)
+    raw_body = db.Column(db.String)
+    body = db.Column(db.String)
+    method = db.Column(db.String)
+    start_time = db.Column(db.String, index=True)
+    view_name = db.Column(db.String)
+    end_time = db.Column(db.String)
+    time_taken = db.Column(db.Float)
+    encoded_headers = db.Column(db.String)
+    meta_time = db.Column(db.Float)
+    meta_num_queries = db.Column(db.Float)
+    meta_time_spent_queries = db.Column(db.String)
+    pyprofile = db.Column(db.Float)
+    num_sql_queries = db.Column(db.Integer)
+    prof_file = db.Column(db.Float)
+
+
+class SqlQuery(Base):
+    __tablename__ = sql_queries_table_name
+
+    id = db.Column(db.Integer, primary_key=True)
+    query = db.Column(db.String)
+    start_time = db.Column(db.String)
+    end_time = db.Column(db.String)
+    time_taken = db.Column(db.String)
+    traceback = db.Column(db.String)
+    request_id = db.Column(db.String, index=True)
+
+
+class SilkRequest(SilkBase):
+    __tablename__ = silk_request_table_name
+
+    id = db.Column(db.String, primary_key=True)
+    path = db.Column(db.String)
+    start_time = db.Column(db.String)
+    view_name = db.Column(db.String)
+
+
+class SilkSqlQuery(SilkBase):
+    __tablename__ = silk_sql_queries_table_name
+
+    id = db.Column(db.Integer, primary_key=True)
+    query = db.Column(db.String)
+    request_id = db.Column(db.String)
+
+
+class IngestState(Base):
+    __tablename__ = ingest_state_table_name
+
+    table_name = db.Column(db.String, primary_key=True)
+    watermark = db.Column(db.String)
+
+
+class ViewUsage(Base):
+    __tablename__ = view_usage_table_name
+
+    view_name = db.Column(db.String, primary_key=True)
+
+
+class ModelUsage(Base):
+    __tablename__ = model_usage_table_name
+    __table_args__ = (db.UniqueConstraint('view_name', 'db_table'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    view_name = db.Column(db.String)
+    db_table = db.Column(db.String)
+    usage = db.Column(db.Integer)
+
+
+class ModelUsageType(Base):
+    __tablename__ = model_usage_type_table_name
+
+    db_table = db.Column(db.String, primary_key=True)
+    query_type = db.Column(db.String, primary_key=True)
+
+
+# rows newer than the stored watermark are appended on the next run
+watermark_columns = {
+    request_table_name: Request.__table__.c.start_time,
+    sql_queries_table_name: SqlQuery.__table__.c.id,
+    view_usage_table_name: Request.__table__.c.start_time,
+    model_usage_table_name: SqlQuery.__table__.c.id,
+}
+
+
+def _get_watermark(conn, table_name):
+    watermark = conn.execute(db.select([IngestState.__table__.c.watermark]).where(
+        IngestState.__table__.c.table_name == table_name)).scalar()
+    if watermark is None:
+        return None
+    return watermark_columns[table_name].type.python_type(watermark)
+
+
+def _set_watermark(conn, table_name, watermark):
+    conn.execute(IngestState.__table__.insert().prefix_with('OR REPLACE'),
+                 {'table_name': table_name, 'watermark': str(watermark)})
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in sqlite_pragmas:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+class DynamicAnalysis:
+    def __init__(self, db_name, directory_path, chunk_size=csv_chunk_size, import_traceback=False, rebuild=False,
+                 silk_db=None):
+        self.engine = db.create_engine('sqlite:///' + db_name)
+        db.event.listen(self.engine, 'connect', _set_sqlite_pragmas)
+        self.chunk_size = chunk_size
+        self.import_traceback = import_traceback
+        session = sessionmaker(bind=self.engine)
+        self.session = session()
+        if silk_db:
+            # the Silk tables are read in place, only the usage counts are kept in db_name
+            self.source_engine = db.create_engine(silk_db)
+            self.source_session = sessionmaker(bind=self.source_engine)()
+            self.request_model, self.query_model = SilkRequest, SilkSqlQuery
+            self._create_database(None, rebuild)
+        else:
+            self.source_engine = self.engine
+            self.source_session = self.session
+            self.request_model, self.query_model = Request, SqlQuery
+            self._create_database(directory_path, rebuild)
+        self.query_analysis = []
+        self.dynamic_data = []
+
+    def extract_data(self, table_models):
+        resolve_models(self.dynamic_data, table_models)
+
+    def _create_database(self, directory_path, rebuild=False):
+        import os
+        if directory_path is None:
+            self._create_tables(rebuild)
+        elif os.path.isfile(directory_path + request_csv_file) and os.path.isfile(directory_path + sql_queries_csv_file):
+            skip_columns = [] if self.import_traceback else ['traceback']
+            try:
+                self._create_tables(rebuild)
+                with self.engine.begin() as conn:
+                    self._import_csv(conn, directory_path + request_csv_file, Request.__table__)
+                    self._import_csv(conn, directory_path + sql_queries_csv_file, SqlQuery.__table__, skip_columns)
+            except Exception:
+                raise Exception('Cannot import files...')
+        else:
+            raise Exception("Missing CSVs for dynamic analysis")
+
+    def _create_tables(self, rebuild=False):
+        if rebuild:
+            Base.metadata.drop_all(self.engine)
+        Base.metadata.create_all(self.engine)
+
+    def _import_csv(self, conn, csv_path, table, skip_columns=()):
+        # stream the csv in bounded chunks, only the columns of the table are parsed
+        # pandas is only loaded by the runs that import a Silk export
+        import pandas as pd
+        columns = [column.name for column in table.columns if column.name not in skip_columns]
+        watermark_column = watermark_columns[table.name].name
+        # every chunk is compared with the watermark of the previous import, the export may be in any order
+        watermark = _get_watermark(conn, table.name)
+        latest = watermark
+        insert = table.insert().prefix_with('OR IGNORE')
+        for chunk in pd.read_csv(csv_path, usecols=lambda column: column in columns, chunksize=self.chunk_size):
+            if watermark is not None:
+                # rows sharing the watermark are kept, OR IGNORE drops the ones already stored
+                chunk = chunk[chunk[watermark_column] >= watermark]
+            if chunk.empty:
+                continue
+            chunk_watermark = chunk[watermark_column].max()
+            latest = chunk_watermark if latest is None else max(latest, chunk_watermark)
+            chunk = chunk.astype(object).where(chunk.notnull(), None)
+            conn.execute(insert, chunk.to_dict('records'))
+        if latest is not None:
+            _set_watermark(conn, table.name, latest)
+
+    def analise_queries(self, since_query_id=None, until_query_id=None):
+        request_model, query_model = self.request_model, self.query_model
+        # one joined pass, queries arrive grouped by request instead of one lookup per request
+        analysed_queries = self.source_session.query(request_model.id, request_model.path, request_model.view_name,
+                                                     query_model.query)
+        join_condition = query_model.request_id == request_model.id
+        if until_query_id is not None:
+            join_condition = db.and_(join_condition, query_model.id <= until_query_id)
+        if since_query_id is None:
+            analysed_queries = analysed_queries.outerjoin(query_model, join_condition)
+        else:
+            analysed_queries = analysed_queries.join(query_model, db.and_(join_condition,
+                                                                          query_model.id > since_query_id))
+        analysed_queries = analysed_queries.filter(request_model.view_name.isnot(None)) \
+            .order_by(request_model.start_time, request_model.id, query_model.id)
+
+        self.query_analysis = []
+        # yield_per streams the rows, with a server side cursor on databases that support one
+        for (request_id, path, view_name), rows in itertools.groupby(analysed_queries.yield_per(1000),
+                                                                     key=lambda row: tuple(row[:3])):
+            tables = []
+            for row in rows:
+                if row.query is None:
+                    continue
+                try:
+                    tables.append(parse_tables_in_query(row.query))
+                except Exception as e:
+                    print("error parsing sql: {}".format(str(e)))
+            self.query_analysis.append({
+                'path': path,
+                'view_name': view_name,
+                'tables': [item for sublist in tables for item in sublist['tables']],
+                'type': [query_type['query_type'] for query_type in tables]
+            })
+        return self.query_analysis
+
+    def update_model_usage(self):
+        # only the queries ingested since the last run are parsed and added to the stored counts
+        request_model, query_model = self.request_model, self.query_model
+        with self.engine.begin() as conn:
+            since_request_time = _get_watermark(conn, view_usage_table_name)
+            since_query_id = _get_watermark(conn, model_usage_table_name)
+        latest_request_time = self.source_session.query(db.func.max(request_model.start_time)).scalar()
+        latest_query_id = self.source_session.query(db.func.max(query_model.id)).scalar()
+
+        # rows written to a live Silk database while this runs are left for the next run
+        self.analise_queries(since_query_id, latest_query_id)
+
+        view_requests = self.source_session.query(request_model.view_name).filter(request_model.view_name.isnot(None),
+                                                                                  request_model.start_time <=
+                                                                                  latest_request_time)
+        if since_request_time is not None:
+            view_requests = view_requests.filter(request_model.start_time >= since_request_time)
+        view_names = set(view_name for (view_name,) in view_requests.distinct())
+
+        analysed_views, usage, usage_types = aggregate_model_usage(self.query_analysis)
+        view_names.update(analysed_views)
+
+        with self.engine.begin() as conn:
+            if view_names:
+                conn.execute(ViewUsage.__table__.insert().prefix_with('OR IGNORE'),
+                             [{'view_name': view_name} for view_name in view_names])
+            if usage:
+                # no upsert, INSERT ... ON CONFLICT needs SQLite 3.24: existing pairs are added to, new ones inserted
+                rows = [{'view_name': view_name, 'db_table': db_table, 'usage': count}
+                        for (view_name, db_table), count in usage.items()]
+                conn.execute(db.text('UPDATE {0} SET usage = usage + :usage '
+                                     'WHERE view_name = :view_name AND db_table = :db_table'
+                                     ''.format(model_usage_table_name)), rows)
+                conn.execute(ModelUsage.__table__.insert().prefix_with('OR IGNORE'), rows)
+            if usage_types:
+                conn.execute(ModelUsageType.__table__.insert().prefix_with('OR IGNORE'),
+                             [{'db_table': db_table, 'query_type': query_type} for db_table, query_type in usage_types])
+            if latest_request_time is not None:
+                _set_watermark(conn, view_usage_table_name, latest_request_time)
+            if latest_query_id is not None:
+                _set_watermark(conn, model_usage_table_name, latest_query_id)
+        return usage
+
+    def calculate_model_usage(self, urls = None):
+        self.update_model_usage()
+        view_names = [view_name for (view_name,) in
+                      self.session.query(ViewUsage.view_name).order_by(ViewUsage.view_name)]
+        usage = Counter()
+        for view_name, db_table, count in self.session.query(ModelUsage.view_name, ModelUsage.db_table,
+                                                             ModelUsage.usage).order_by(ModelUsage.id):
+            usage[(view_name, db_table)] += count
+        usage_types = set(self.session.query(ModelUsageType.db_table, ModelUsageType.query_type))
+
+        self.dynamic_data = build_dynamic_data(view_names, usage, usage_types, urls or [])
+        return self.dynamic_data
+
+    def calculate_usage_delta(self, urls = None):
+        # same shape as calculate_model_usage, db_info only holds the usage ingested by this run
+        usage = self.update_model_usage()
+        view_names = [view_name for (view_name,) in
+                      self.session.query(ViewUsage.view_name).order_by(ViewUsage.view_name)]
+        usage_types = set(self.session.query(ModelUsageType.db_table, ModelUsageType.query_type))
+        return build_dynamic_data(view_names, usage, usage_types, urls or [])
@@ -0,0 +1,134 @@
+import cProfile
+import json
+import pstats
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+profile_format_version = 1
+cprofile_top_functions = 25
+
+
+class Profiler:
+    # Stage timers, traced peak memory, counters and optional cProfile output, all written to one JSON file.
+    # Stages can nest, a stage reports its time and peak memory with and without the stages it ran.
+    # Peak memory is counted from the traced heap at the start of the stage, memory kept by earlier stages is left out,
+    # and the peak without the stages it ran also leaves out the memory they kept.
+
+    def __init__(self, enabled=True, memory=True, cprofile=False):
+        self.enabled = enabled
+        self.memory = memory and enabled
+        self.cprofile = cprofile and enabled
+        self.stages = OrderedDict()
+        self.counters = OrderedDict()
+        self._stack = []
+        self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name, **info):
+        if not self.enabled:
+            yield
+            return
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+        parent = self._stack[-1] if self._stack else None
+        if parent is not None:
+            if parent['profile']:
+                parent['profile'].disable()
+            if self.memory:
+                _end_segment(parent)
+
+        frame = {'name': name, 'children': 0.0, 'peak': 0, 'self_peak': 0, 'own': 0,
+                 'profile': cProfile.Profile() if self.cprofile else None}
+        if self.memory:
+            _start_segment(frame)
+            frame['start'] = frame['peak'] = frame['segment']
+        self._stack.append(frame)
+        start = time.perf_counter()
+        if frame['profile']:
+            frame['profile'].enable()
+        try:
+            yield
+        finally:
+            if frame['profile']:
+                frame['profile'].disable()
+            elapsed = time.perf_counter() - start
+            self._stack.pop()
+
+            result = OrderedDict(seconds=elapsed, self_seconds=elapsed - frame['children'])
+            if self.memory:
+                current = _end_segment(frame)
+                if hasattr(tracemalloc, 'reset_peak'):
+                    result['peak_memory'] = frame['peak'] - frame['start']
+                    result['self_peak_memory'] = frame['self_peak']
+                else:
+                    # before python 3.9 the traced peak cannot be reset, it would be the peak of the whole run
+                    result['peak_memory'] = result['self_peak_memory'] = None
+                result['memory_delta'] = current - frame['start']
+            result.update(info)
+            if frame['profile']:
+                result['functions'] = _top_functions(frame['profile'])
+            self.stages[name] = result
+
+            if parent is not None:
+                parent['children'] += elapsed
+                if self.memory:
+                    parent['peak'] = max(parent['peak'], frame['peak'])
+                    _start_segment(parent)
+                if parent['profile']:
+                    parent['profile'].enable()
+
+    def annotate(self, name, **info):
+        if self.enabled and name in self.stages:
+            self.stages[name].update(info)
+
+    def count(self, name, value=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        if self.enabled:
+            self.counters[name] = value
+
+    def to_dict(self):
+        return OrderedDict([
+            ('version', profile_format_version),
+            ('stages', self.stages),
+            ('counters', self.counters),
+        ])
+
+    def write(self, file_path):
+        if self._started_tracing and not self._stack:
+            tracemalloc.stop()
+            self._started_tracing = False
+        with open(file_path, 'w') as profile_file:
+            json.dump(self.to_dict(), profile_file, indent=2)
+
+
+def _start_segment(frame):
+    # a stage runs in segments between the stages it runs, each one is measured from the heap at its start
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    frame['segment'] = tracemalloc.get_traced_memory()[0]
+
+
+def _end_segment(frame):
+    current, peak = tracemalloc.get_traced_memory()
+    frame['peak'] = max(frame['peak'], peak)
+    frame['self_peak'] = max(frame['self_peak'], frame['own'] + peak - frame['segment'])
+    frame['own'] += current - frame['segment']
+    return current
+
+
+def _top_functions(profile):
+    stats = pstats.Stats(profile).stats
+    functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:cprofile_top_functions]
+    return [OrderedDict([
+        ('function', '{}:{}({})'.format(*function)),
+        ('calls', calls),
+        ('total_seconds', total_time),
+        ('cumulative_seconds', cumulative_time),
+    ]) for function, (primitive_calls, calls, total_time, cumulative_time, callers) in functions]
@@ -0,0 +1,168 @@
+import networkx as nx
+import numpy as np
+from scipy import sparse
+
+
+class SparseGraph:
+    # Undirected weighted graph, node names are interned to integer ids and the weights live in a
+    # symmetric CSR matrix. It answers the read calls the analysis makes on a networkx graph.
+
+    def __init__(self):
+        self.names = []
+        self.index = {}
+        self.node_attributes = {}
+        self.matrix = sparse.csr_matrix((0, 0), dtype=np.float64)
+        # edges added since the last flush, (low id, high id) -> weight
+        self._pending = {}
+
+    def intern(self, name):
+        node_id = self.index.get(name)
+        if node_id is None:
+            node_id = self.index[name] = len(self.names)
+            self.names.append(name)
+        return node_id
+
+    def add_node(self, name, **attributes):
+        self.intern(name)
+        if attributes:
+            self.node_attributes.setdefault(name, {}).update(attributes)
+
+    def add_nodes_from(self, names):
+        for name in names:
+            self.intern(name)
+
+    def add_edge(self, origin, destination, weight=1):
+        origin_id, destination_id = self.intern(origin), self.intern(destination)
+        self._pending[(min(origin_id, destination_id), max(origin_id, destination_id))] = weight
+
+    def add_edges_from(self, edges):
+        for edge in edges:
+            self.add_edge(edge[0], edge[1], **(edge[2] if len(edge) > 2 else {}))
+
+    def _flush(self):
+        size = len(self.names)
+        if self.matrix.shape[0] != size:
+            self.matrix.resize((size, size))
+        if not self._pending:
+            return
+        edges = np.array(list(self._pending), dtype=np.int64).reshape(-1, 2)
+        weights = np.fromiter(self._pending.values(), dtype=np.float64, count=len(self._pending))
+        self._pending = {}
+
+        loops = edges[:, 0] == edges[:, 1]
+        current = self.matrix.tocoo()
+        rows = np.concatenate([current.row, edges[:, 0], edges[~loops, 1]])
+        cols = np.concatenate([current.col, edges[:, 1], edges[~loops, 0]])
+        values = np.concatenate([current.data, weights, weights[~loops]])
+        # adding an edge again replaces its weight, as networkx does, the last entry of a cell wins.
+        # Stored zeros are kept, an edge of weight 0 is still an edge.
+        cells = rows * size + cols
+        _, last = np.unique(cells[::-1], return_index=True)
+        keep = len(cells) - 1 - last
+        self.matrix = sparse.csr_matrix((values[keep], (rows[keep], cols[keep])), shape=(size, size))
+        self.matrix.sort_indices()
+
+    def csr(self):
+        self._flush()
+        return self.matrix
+
+    def _weight(self, origin_id, destination_id):
+        key = (min(origin_id, destination_id), max(origin_id, destination_id))
+        if key in self._pending:
+            return self._pending[key]
+        if origin_id >= self.matrix.shape[0] or destination_id >= self.matrix.shape[0]:
+            return None
+        start, end = self.matrix.indptr[origin_id], self.matrix.indptr[origin_id + 1]
+        position = start + np.searchsorted(self.matrix.indices[start:end], destination_id)
+        if position < end and self.matrix.indices[position] == destination_id:
+            return self.matrix.data[position]
+        return None
+
+    def has_node(self, name):
+        return name in self.index
+
+    def has_edge(self, origin, destination):
+        return self.get_edge_data(origin, destination) is not None
+
+    def get_edge_data(self, origin, destination, default=None):
+        if origin not in self.index or destination not in self.index:
+            return default
+        weight = self._weight(self.index[origin], self.index[destination])
+        return default if weight is None else {'weight': float(weight)}
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, name):
+        self._flush()
+        node_id = self.index[name]
+        start, end = self.matrix.indptr[node_id], self.matrix.indptr[node_id + 1]
+        return {self.names[neighbor]: {'weight': float(weight)}
+                for neighbor, weight in zip(self.matrix.indices[start:end], self.matrix.data[start:end])}
+
+    @property
+    def nodes(self):
+        return list(self.names)
+
+    def degree(self):
+        self._flush()
+        # a self loop counts twice, as in networkx, whatever its weight
+        entries = self.matrix.tocoo()
+        loops = np.bincount(entries.row[entries.row == entries.col], minlength=len(self.names))
+        return list(zip(self.names, np.diff(self.matrix.indptr) + loops))
+
+    def number_of_nodes(self):
+        return len(self.names)
+
+    def number_of_edges(self):
+        self._flush()
+        return sparse.triu(self.matrix).nnz
+
+    def edges(self, data=False):
+        self._flush()
+        upper = sparse.triu(self.matrix).tocoo()
+        for origin, destination, weight in zip(upper.row, upper.col, upper.data):
+            if data:
+                yield self.names[origin], self.names[destination], {'weight': float(weight)}
+            else:
+                yield self.names[origin], self.names[destination]
+
+    def subgraph(self, names):
+        self._flush()
+        node_ids = sorted(self.index[name] for name in names)
+        subgraph = SparseGraph()
+        subgraph.names = [self.names[node_id] for node_id in node_ids]
+        subgraph.index = {name: node_id for node_id, name in enumerate(subgraph.names)}
+        subgraph.node_attributes = {name: dict(self.node_attributes[name]) for name in subgraph.names
+                                    if name in self.node_attributes}
+        subgraph.matrix = self.matrix[node_ids][:, node_ids].tocsr()
+        return subgraph
+
+    def remove_nodes_from(self, names):
+        removed = {self.index[name] for name in names if name in self.index}
+        if not removed:
+            return
+        kept = self.subgraph(name for node_id, name in enumerate(self.names) if node_id not in removed)
+        self.names, self.index = kept.names, kept.index
+        self.node_attributes, self.matrix = kept.node_attributes, kept.matrix
+
+    def to_networkx(self):
+        graph = nx.Graph()
+        for name in self.names:
+            graph.add_node(name, **self.node_attributes.get(name, {}))
+        graph.add_weighted_edges_from((origin, destination, data['weight'])
+                                      for origin, destination, data in self.edges(data=True))
+        return graph
+
+
+def to_networkx(graph):
+    # drawing and GEXF export need a networkx graph
+    if isinstance(graph, SparseGraph):
+        return graph.to_networkx()
+    return graph
@@ -1,43 +1,77 @@
 import ast
+import hashlib
+import json
 import os
 import re
-from collections import defaultdict
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from fnmatch import fnmatch
 
 from modules.GraphNetwork import GraphNetwork
+from modules.tableUtils import normalize_table
+
+
+# bump when HoneyMaker.to_dict changes, cached analyses of older versions are ignored
+analyser_version = 1
 
 
 class StaticAnalysis:
 
-    def __init__(self, file_pattern='*.py'):
+    def __init__(self, file_pattern='*.py', cache_dir=None):
         self.file_pattern = file_pattern
         self.project_analysis = []
         self.project_path = None
         self.urls = []
+        # normalized db_table -> Django model name, the first model declaring a table wins
+        self.table_models = {}
+        self.cache = AnalysisCache(cache_dir) if cache_dir else None
 
     def create_static_relations(self):
         module_list = self.project_analysis
         relations = defaultdict(list)
-        for module in module_list:
+        # class name -> number of modules defining it, an import matches once per definition
+        class_index = Counter(class_name for _module in module_list for class_name in _module.get('classes', []))
+        view_modules = [module for module in module_list if len(module['django_views']) > 0]
+        for module in view_modules:
+            view_name = module['django_views'][0]['name']
             for _import in module.get('imports', []):
-                for _module in module_list:
-                    for class_module in _module.get('classes', []):
-                        # print("{} - {}".format(_import['name'] , class_module.name))
-                        if _import.get('name', []) == class_module.name:
-                            if len(module['django_views']) > 0:
-                                relations[module['django_views'][0]['name']].append({'name': _import.get('name', None),
-                                                                                     'usage': _import.get('usage',
-                                                                                                          None)})
+                for _ in range(class_index.get(_import.get('name'), 0)):
+                    relations[view_name].append({'name': _import.get('name', None),
+                                                 'usage': _import.get('usage', None)})
         return relations
 
-    def analyze_django_project(self, path_of_project):
+    def analyze_django_project(self, path_of_project, jobs=1):
         self.project_path = path_of_project
+        file_paths = []
         for path, subdirs, files in os.walk(path_of_project):
             for name in files:
                 if fnmatch(name, self.file_pattern):
-                    honeyMaker = HoneyMaker(os.path.join(path, name))
-                    honeyMaker.parse_file()
-                    self.project_analysis.append(honeyMaker.to_dict())
+                    file_paths.append(os.path.join(path, name))
+
+        analysis = [self.cache.get(file_path) if self.cache else None for file_path in file_paths]
+        changed_files = [file_path for file_path, module in zip(file_paths, analysis) if module is None]
+
+        if jobs > 1:
+            # map keeps the walk order, so the merged analysis matches the serial one
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                chunk_size = max(1, len(changed_files) // (jobs * 4))
+                parsed_modules = list(executor.map(parse_module, changed_files, chunksize=chunk_size))
+        else:
+            parsed_modules = [parse_module(file_path) for file_path in changed_files]
+
+        parsed_modules = iter(parsed_modules)
+        for idx, module in enumerate(analysis):
+            if module is None:
+                analysis[idx] = next(parsed_modules)
+                if self.cache:
+                    self.cache.put(file_paths[idx], analysis[idx])
+        self.project_analysis.extend(analysis)
+        for module in analysis:
+            for django_model in module['django_models']:
+                self.table_models.setdefault(normalize_table(django_model['db_table']), django_model['name'])
+
+        if self.cache:
+            print("AST cache: {} hits, {} misses".format(self.cache.hits, self.cache.misses))
 
     def list_models(self):
         if self.project_analysis:
@@ -134,20 +168,73 @@ class StaticAnalysis:
     def _analyse_graph_cut(self, graph_cut, original_graph):
         missing_files = []
         for node in graph_cut.nodes:
-            relations = [relation for relation in original_graph.edges(node)]
-            # relation = list(sum(relation, ()))
-            for relation in relations:
-                if graph_cut.has_node(relation[0]) and graph_cut.has_node(relation[1]):
-                    relation_weight = original_graph[relation[0]][relation[1]].get('weight', 0)
-                    graph_cut.add_edge(relation[1], relation[0], weigth=relation_weight)
-                else:
-                    print("Missing: {}".format(relation[1] if graph_cut.has_node(relation[0]) else relation[0]))
-                    missing_files.append(
-                        relation[1] if graph_cut.has_node(relation[0]) else relation[0]
-                    )
+            for neighbor in original_graph[node]:
+                if not graph_cut.has_node(neighbor):
+                    print("Missing: {}".format(neighbor))
+                    missing_files.append(neighbor)
         return missing_files
 
 
+class AnalysisCache:
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, file_path):
+        return os.path.join(self.cache_dir, hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest() + '.json')
+
+    @staticmethod
+    def _content_hash(file_path):
+        with open(file_path, 'rb') as source_file:
+            return hashlib.sha256(source_file.read()).hexdigest()
+
+    def get(self, file_path):
+        entry = None
+        if os.path.isfile(self._entry_path(file_path)):
+            try:
+                with open(self._entry_path(file_path)) as entry_file:
+                    entry = json.load(entry_file)
+            except ValueError:
+                entry = None
+
+        if entry and entry['version'] == analyser_version and entry['path'] == os.path.abspath(file_path):
+            stat = os.stat(file_path)
+            if entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                self.hits += 1
+                return entry['analysis']
+            # touched but not edited, keep the analysis and refresh the stat key
+            if entry['hash'] == self._content_hash(file_path):
+                self.hits += 1
+                self._write(file_path, entry['hash'], entry['analysis'])
+                return entry['analysis']
+        self.misses += 1
+        return None
+
+    def put(self, file_path, analysis):
+        self._write(file_path, self._content_hash(file_path), analysis)
+
+    def _write(self, file_path, content_hash, analysis):
+        stat = os.stat(file_path)
+        with open(self._entry_path(file_path), 'w') as entry_file:
+            json.dump({
+                'version': analyser_version,
+                'path': os.path.abspath(file_path),
+                'mtime': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'hash': content_hash,
+                'analysis': analysis
+            }, entry_file)
+
+
+def parse_module(file_path):
+    honeyMaker = HoneyMaker(file_path)
+    honeyMaker.parse_file()
+    return honeyMaker.to_dict()
+
+
 class HoneyMaker(ast.NodeVisitor):
 
     def __init__(self, file_path):
@@ -169,7 +256,7 @@ class HoneyMaker(ast.NodeVisitor):
             'module_name': self.module_name,
             'module_path': self.module_path,
             'names': self.names,
-            'classes': self.classes,
+            'classes': self.class_names,
             'class_names': self.class_names,
             'imports': self.imports,
             'import_info': self.number_of_imports,
@@ -1,56 +1,51 @@
-import itertools
+import functools
 import re
+from collections import Counter, OrderedDict, defaultdict
 
-import pandas as pd
-import sqlalchemy as db
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from modules.tableUtils import normalize_table
 
-Base = declarative_base()
-
-request_table_name = 'REQUEST'
 request_csv_file = '/silk_request.csv'
-sql_queries_table_name = 'SQL_QUERIES'
 sql_queries_csv_file = '/silk_sqlquery.csv'
 
+query_cache_size = 4096
+query_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+query_in_lists = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+
 
-class Request(Base):
-    __tablename__ = request_table_name
-
-    id = db.Column(db.Integer, primary_key=True)
-    path = db.Column(db.String)
-    query_params = db.Column(db.String)
-    raw_body = db.Column(db.String)
-    body = db.Column(db.String)
-    method = db.Column(db.String)
-    start_time = db.Column(db.String)
-    view_name = db.Column(db.String)
-    end_time = db.Column(db.String)
-    time_taken = db.Column(db.Float)
-    encoded_headers = db.Column(db.String)
-    meta_time = db.Column(db.Float)
-    meta_num_queries = db.Column(db.Float)
-    meta_time_spent_queries = db.Column(db.String)
-    pyprofile = db.Column(db.Float)
-    num_sql_queries = db.Column(db.Integer)
-    prof_file = db.Column(db.Float)
-
-
-class SqlQuery(Base):
-    __tablename__ = sql_queries_table_name
-
-    id = db.Column(db.Integer, primary_key=True)
-    query = db.Column(db.String)
-    start_time = db.Column(db.String)
-    end_time = db.Column(db.String)
-    time_taken = db.Column(db.String)
-    traceback = db.Column(db.String)
-    request_id = db.Column(db.String)
+def query_fingerprint(sql_str):
+    # queries that only differ in their literals share the same fingerprint
+    fingerprint = query_literals.sub('?', sql_str)
+    return query_in_lists.sub('IN (?)', fingerprint)
 
 
 def parse_tables_in_query(sql_str):
+    tables, query_type = _parse_query_fingerprint(query_fingerprint(sql_str))
+    return {
+        'tables': set(tables),
+        'query_type': query_type
+    }
+
+
+def query_cache_info():
+    info = _parse_query_fingerprint.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'max_size': info.maxsize,
+        'hit_rate': info.hits / lookups if lookups else 0.0
+    }
+
+
+def clear_query_cache():
+    _parse_query_fingerprint.cache_clear()
+
+
+@functools.lru_cache(maxsize=query_cache_size)
+def _parse_query_fingerprint(fingerprint):
     # remove the /* */ comments
-    q = re.sub(r"/\*[^*]*\*+(?:[^*/][^*]*\*+)*/", "", sql_str)
+    q = re.sub(r"/\*[^*]*\*+(?:[^*/][^*]*\*+)*/", "", fingerprint)
 
     # remove whole line -- and # comments
     lines = [line for line in q.splitlines() if not re.match("^\s*(--|#)", line)]
@@ -73,101 +68,77 @@ def parse_tables_in_query(sql_str):
             get_next = False
         get_next = tok.lower() in ["from", "join"]
 
-    return {
-        'tables': result,
-        'query_type': sql_str.split(" ")[0]
-    }
+    return frozenset(result), fingerprint.split(" ")[0]
 
 
 def parse_query_type(sql_str: str) -> str:
     return sql_str.split(" ")[0]
 
 
-class DynamicAnalysis:
-    def __init__(self, db_name, directory_path):
-        self.engine = db.create_engine('sqlite:///' + db_name)
-        self._create_database(directory_path)
-        session = sessionmaker(bind=self.engine)
-        self.session = session()
-        self.query_analysis = []
-        self.dynamic_data = []
-
-    def extract_data(self, django_table_and_model_names):
-        dynamic_data = self.dynamic_data
-        for view in dynamic_data:
-            for model in view['db_info']:
-                model_name = [django_name for django_name in django_table_and_model_names if
-                              django_name['db_table'].replace('"', '').lower() == model['model'].replace('"',
-                                                                                                         '').lower()]
-                if model_name:
-                    model['model'] = model_name[0]['django_model_name']
-
-    def _create_database(self, directory_path):
-        conn = self.engine.connect()
-
-        import os
-        if os.path.isfile(directory_path + request_csv_file) and os.path.isfile(directory_path + sql_queries_csv_file):
-            try:
-                read_requests = pd.read_csv(directory_path + request_csv_file)
-                read_requests.to_sql(request_table_name, conn, if_exists='replace',
-                                     index=True)  # Insert the values from the csv file into the table 'REQUEST'
-
-                read_sql_queries = pd.read_csv(directory_path + sql_queries_csv_file)
-                read_sql_queries.to_sql(sql_queries_table_name, conn, if_exists='replace',
-                                        index=True)  # Replace the values from the csv file into the table 'SQL_REQUESTS'
-            except Exception:
-                raise Exception('Cannot import files...')
-        else:
-            raise Exception("Missing CSVs for dynamic analysis")
-
-    def analise_queries(self):
-        requests = self.session.query(Request).distinct(Request.path).filter(Request.view_name.isnot(None)).all()
-        self.query_analysis = []
-        for request in requests:
-            tables = []
-            sql_query = self.session.query(SqlQuery).filter(SqlQuery.request_id.in_([request.id])).all()
-            # print(sql_query)
-            for query in sql_query:
-                try:
-                    tables.append(parse_tables_in_query(query.query))
-                    # print(tables)
-                except Exception as e:
-                    print("error parsing sql: {}".format(str(e)))
-            self.query_analysis.append({
-                'path': request.path,
-                'view_name': request.view_name,
-                'tables': [item for sublist in tables for item in sublist['tables']],
-                'type': [query_type['query_type'] for query_type in tables]
+def aggregate_model_usage(query_analysis):
+    view_names = set()
+    usage = Counter()
+    usage_types = set()
+    for analysis in query_analysis:
+        view_name = analysis['view_name']
+        view_names.add(view_name)
+        usage.update((view_name, db_table) for db_table in analysis['tables'])
+        for db_table in set(analysis['tables']):
+            usage_types.update((db_table, query_type) for query_type in analysis['type'])
+    return view_names, usage, usage_types
+
+
+def build_dynamic_data(view_names, usage, usage_types, urls):
+    tables_by_view = defaultdict(Counter)
+    for (view_name, db_table), count in usage.items():
+        tables_by_view[view_name][db_table] += count
+
+    # a table gets the query types of every table whose name contains it, as the list based version did
+    types_by_table = defaultdict(set)
+    for db_table, query_type in usage_types:
+        types_by_table[db_table].add(query_type)
+    model_types = {}
+    for db_table in set(db_table for _, db_table in usage) | set(types_by_table):
+        model_types[db_table] = set().union(*[query_types for table, query_types in types_by_table.items()
+                                              if db_table in table])
+
+    modules_by_call = defaultdict(OrderedDict)
+    url_modules = set()
+    for url in urls:
+        modules_by_call[url['functionCall']][url['module']] = None
+        url_modules.add(url['module'])
+
+    dynamic_data = []
+    for view_name in view_names:
+        # views are matched by name containment over the distinct view names only
+        view_tables = Counter()
+        for analysed_view, tables in tables_by_view.items():
+            if view_name in analysed_view:
+                view_tables.update(tables)
+        db_info = [{
+            'model': db_table,
+            'usage': count,
+            'model_type': model_types[db_table]
+        } for db_table, count in view_tables.items()]
+
+        module_name = list(modules_by_call.get(view_name, ()))
+        if len(module_name) == 0 and view_name in url_modules:
+            module_name = [view_name]
+        if module_name:
+            dynamic_data.append({
+                'view_name': view_name,
+                'modules': module_name,
+                'main_module': module_name[0],
+                'db_info': db_info
             })
-        return self.query_analysis
-
-    def calculate_model_usage(self, urls = None):
-        self.analise_queries()
-        self.dynamic_data = []
-        view_names = set([view['view_name'] for view in self.query_analysis])
-
-        for view_name in view_names:
-            view_tables = [model['tables'] for model in self.query_analysis if view_name in model['view_name']]
-            view_tables = [item for sublist in view_tables for item in sublist]
-            db_info = []
-            for db_table in [ele for ind, ele in enumerate(view_tables, 1) if ele not in view_tables[ind:]]:
-                # print("{} {}".format(db_table, view_tables.count(db_table)))
-                model_type = set(list(itertools.chain(*[teste['type'] for teste in self.query_analysis if
-                                       any(db_table in table for table in teste['tables'])])))
-                db_info.append({
-                    'model': db_table,
-                    'usage': view_tables.count(db_table),
-                    'model_type': model_type
-                })
-            module_name = list(set([view['module'] for view in urls if view['functionCall'] == view_name]))
-            if len(module_name) == 0:
-                module_name = list(set([view['module'] for view in urls if view['module'] == view_name]))
-            if module_name:
-                self.dynamic_data.append({
-                    'view_name': view_name,
-                    'modules': module_name,
-                    'main_module': module_name[0],
-                    'db_info': db_info
-                })
-
-        return self.dynamic_data
+    return dynamic_data
+
+
+def resolve_models(dynamic_data, table_models, model_names=None):
+    # db tables are replaced by the Django model using them, model_names limits it to known models
+    for view in dynamic_data:
+        for model in view['db_info']:
+            model_name = table_models.get(normalize_table(model['model']))
+            if model_name and (model_names is None or model_name.lower() in model_names):
+                model['model'] = model_name
+    return dynamic_data
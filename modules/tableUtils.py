@@ -0,0 +1,3 @@
+def normalize_table(db_table):
+    # db tables are compared without quotes and case, as Django declares them and as Silk logs them
+    return db_table.replace('"', '').lower()
@@ -1,10 +1,17 @@
+import json
 import optparse
+import os
 import sys
 import traceback
 
-from modules.ModelParser import ModelParser
-from modules.StaticAnalysis import StaticAnalysis
-from modules.profileUtils import DynamicAnalysis
+from modules.CommunityDetection import ALGORITHMS
+from modules.GraphNetwork import BACKENDS
+from modules.PartitionSweep import SWEEP_ALGORITHMS, SWEEP_RESOLUTIONS, SWEEP_SEEDS
+from modules.Pipeline import Pipeline, graph_model_names
+from modules.Profiler import Profiler
+from modules.profileUtils import resolve_models
+
+default_cache_dir = '.monobreaker_cache'
 
 
 def header():
@@ -17,9 +24,32 @@ def header():
     print(header)
 
 
+def print_sweep(sweep_results):
+    if not sweep_results:
+        return
+    print("Pareto best partitions:")
+    for result in sweep_results:
+        if result['pareto']:
+            print("services: {} modularity: {:.4f} cut weight: {:.2f} balance: {:.2f} runs: {}".format(
+                result['services'], result['modularity'], result['cut_weight'], result['balance'],
+                ", ".join("{algorithm}(seed={seed}, resolution={resolution})".format(**run)
+                          for run in result['runs'])))
+
+
+def print_report(report):
+    print("\n\n\n\n\n\nTotal Files: {}\n"
+          "Django_Views: {}\n"
+          "Django_Models: {}\n"
+          "".format(report['files'], report['django_views'], report['django_models']))
+    for changes in report['changes']:
+        print('GraphNumber: {}'.format(changes['graph_number']))
+        print('list_of_files: {}'.format([str(file) for file in changes['list_of_files']]))
+        print('instructions: %s' % '\n'.join(map(str, changes['instructions'])))
+        print("\n\n\n\n\n")
+
+
 def main():
     db_name = 'Test.db'
-    directory_path = '/home/tiago/Documents/trash/sample_proj/example_1/'
 
     parser = optparse.OptionParser()
     parser.add_option("--pydir", action="store", dest="pydir",
@@ -28,70 +58,89 @@ def main():
                       help="Disable user input")
     parser.add_option("--dbname", action="store", dest="dbname",
                       help="Input to sqlite database (Default:{})".format(db_name))
+    parser.add_option("--algorithm", action="store", dest="algorithm", type="choice",
+                      choices=sorted(ALGORITHMS), default='girvan_newman',
+                      help="Community detection algorithm: {} (Default:girvan_newman)".format(
+                          ", ".join(sorted(ALGORITHMS))))
+    parser.add_option("--rebuild-db", action="store_true", dest="rebuild_db", default=False,
+                      help="Drop the sqlite database and import the Silk CSVs from scratch")
+    parser.add_option("--silk-db", action="store", dest="silk_db",
+                      help="Connection string of the Silk database, replaces the exported CSVs")
+    parser.add_option("--jobs", action="store", dest="jobs", type="int", default=1,
+                      help="Number of processes used to parse the project files and run --sweep (Default:1)")
+    parser.add_option("--cache-dir", action="store", dest="cache_dir",
+                      help="Directory where the analysis of unchanged files is cached between runs")
+    parser.add_option("--betweenness-jobs", action="store", dest="betweenness_jobs", type="int", default=1,
+                      help="Number of processes computing edge betweenness for girvan_newman (Default:1)")
+    parser.add_option("--betweenness-samples", action="store", dest="betweenness_samples", type="int",
+                      help="Approximate edge betweenness from this many sampled source nodes")
+    parser.add_option("--betweenness-seed", action="store", dest="betweenness_seed", type="int", default=0,
+                      help="Seed of the source nodes sampled by --betweenness-samples (Default:0)")
+    parser.add_option("--graph-backend", action="store", dest="graph_backend", type="choice",
+                      choices=sorted(BACKENDS), default="networkx",
+                      help="Graph storage, sparse keeps large graphs in a compact matrix (Default:networkx)")
+    parser.add_option("--services", action="store", dest="services", type="int",
+                      help="Number of services to split the project into")
+    parser.add_option("--auto-k", action="store_true", dest="auto_k", default=False,
+                      help="Pick the number of services with the best modularity, at most --services when given")
+    parser.add_option("--sweep", action="store_true", dest="sweep", default=False,
+                      help="Run a grid of algorithms, resolutions and seeds and keep the best partition")
+    parser.add_option("--sweep-algorithms", action="store", dest="sweep_algorithms",
+                      default=",".join(SWEEP_ALGORITHMS),
+                      help="Comma separated algorithms for --sweep (Default:{})".format(",".join(SWEEP_ALGORITHMS)))
+    parser.add_option("--sweep-resolutions", action="store", dest="sweep_resolutions",
+                      default=",".join(map(str, SWEEP_RESOLUTIONS)),
+                      help="Comma separated resolutions for --sweep (Default:{})".format(
+                          ",".join(map(str, SWEEP_RESOLUTIONS))))
+    parser.add_option("--sweep-seeds", action="store", dest="sweep_seeds", type="int", default=SWEEP_SEEDS,
+                      help="Number of seeds per algorithm and resolution for --sweep (Default:{})".format(SWEEP_SEEDS))
+    parser.add_option("--output", action="store", dest="output",
+                      help="Write the report of the run command to this JSON file")
+    parser.add_option("--profile", action="store", dest="profile",
+                      help="Write the time, peak memory and counters of every stage to this JSON file")
+    parser.add_option("--profile-functions", action="store_true", dest="profile_functions", default=False,
+                      help="Add the slowest functions of every stage to --profile, runs under cProfile")
+    parser.usage = "%prog [run] --pydir=PYDIR [options]\n\n" \
+                   "run: analyse without prompts, stages with unchanged inputs are reused from the cache dir " \
+                   "(Default:{})".format(default_cache_dir)
     (options, args) = parser.parse_args()
 
     if options.dbname:
         db_name = options.dbname
 
     if options.pydir:
+        directory_path = options.pydir
+        headless = bool(args) and args[0] == 'run'
+        if headless:
+            # nothing is shown without prompts, matplotlib must not start a GUI backend when it is loaded
+            os.environ['MPLBACKEND'] = 'Agg'
+            if not options.cache_dir:
+                options.cache_dir = default_cache_dir
+        artifact_dir = os.path.join(options.cache_dir, 'stages') if options.cache_dir else None
+        profiler = Profiler(cprofile=options.profile_functions) if options.profile else None
+        pipeline = Pipeline(options, directory_path, db_name, artifact_dir, profiler)
         try:
-            print("Starting Static Analysis")
-            model_analizer = ModelParser(directory_path)
-            model_analizer.read_model_file()
-            model_analizer.create_graph()
-            model_analizer.cut_graph()
-
-            static_analisys = StaticAnalysis()
-            static_analisys.analyze_django_project(directory_path)
-
-            # list_of_changes = static_analisys.creyate_report(model_analizer.graph_network)
-
-            urls = static_analisys.parse_url_file()
-            new_relations = static_analisys.create_static_relations()
-
-            model_analizer.update_static_relations(new_relations)
-
-
-            # sorted(model_analizer.graph_network.main_graph.degree, key=lambda x: x[1], reverse=False)
-
-            show_graph = 'n'# input("show initial graph (y/n):")
-
-            if "y" in show_graph.lower():
-                print("Close the plot to continue")
-                model_analizer.show_graph(labels=False)
-
-            print("Starting Dynamic Analysis")
-
-            new_dynamic_analysis = DynamicAnalysis(db_name, directory_path)
-            dynamic_analysis = new_dynamic_analysis.calculate_model_usage(urls)
-
-            django_model_names = [names for names in model_analizer.graph_network.main_graph.nodes]
-
-            django_table_and_model_names = []
-
-            for django_model in django_model_names:
-                model_list = [static_django_model['django_models'] for static_django_model in
-                              static_analisys.project_analysis if len(static_django_model['django_models']) > 0]
-                model_match = [model for model in model_list if django_model.lower() == model[0]['name'].lower()]
-                if model_match:
-                    django_table_and_model_names.append({
-                        'django_model_name': model_match[0][0]['name'],
-                        'db_table': model_match[0][0]['db_table']
-                    })
-
-            transform_analysis = dynamic_analysis
-
-            for view in transform_analysis:
-                for model in view['db_info']:
-                    model_name = [django_name for django_name in django_table_and_model_names if
-                                  django_name['db_table'].replace('"', '').lower() == model['model'].replace('"',
-                                                                                                             '').lower()]
-                    if model_name:
-                        model['model'] = model_name[0]['django_model_name']
-
-            model_analizer.graph_network.update(transform_analysis)
-
-            model_analizer.cut_graph()
+            if headless:
+                report = pipeline.run()
+                print_sweep(pipeline.get('cuts')['sweep'])
+                print_report(report)
+                print("Reused stages: {}".format(", ".join(pipeline.reused) or "none"))
+                print("Computed stages: {}".format(", ".join(pipeline.computed) or "none"))
+                if options.output:
+                    with open(options.output, 'w') as output_file:
+                        json.dump(report, output_file, indent=2)
+                if profiler:
+                    profiler.write(options.profile)
+                sys.exit(0)
+
+            model_analizer = pipeline.model_parser()
+            static_analisys = pipeline.static_analysis()
+            urls = static_analisys.urls
+            transform_analysis = pipeline.transform_analysis()
+            print_sweep(pipeline.cuts()['sweep'])
+            if profiler:
+                profiler.write(options.profile)
+            betweenness = pipeline.betweenness
             model_analizer.create_main_graph_gephi()
             while True:
                 final_options = input("Options:\n" 
@@ -100,6 +149,7 @@ def main():
                                       "3: Create Report\n"
                                       "4: Delete Single Nodes\n"
                                       "5: Create Gephi\n"
+                                      "6: Reload Dynamic Data\n"
                                       "Other input will terminate the program\n")
                 if final_options.isdigit():
                     final_options = int(final_options)
@@ -111,38 +161,42 @@ def main():
                         model_analizer.show_graph_cuts()
                     if final_options == 3:
                         final_changes = static_analisys.create_report(model_analizer.graph_network, transform_analysis)
-
-                        files_analyzed = len(static_analisys.project_analysis)
-                        django_views = [names for names in static_analisys.project_analysis if
-                                        len(names['django_views']) > 0]
-                        django_models = [names for names in static_analisys.project_analysis if
-                                         len(names['django_models']) > 0]
-                        print("\n\n\n\n\n\nTotal Files: {}\n"
-                              "Django_Views: {}\n"
-                              "Django_Models: {}\n"
-                              "".format(files_analyzed, len(django_views), len(django_models)))
-                        for changes in final_changes:
-                            print('GraphNumber: {}'.format(changes['graph_number']))
-                            print('list_of_files: {}'.format( [str(file) for file in changes['list_of_files']]))
-                            print('instructions: %s' % '\n'.join(map(str, changes['instructions'])))
-                            print("\n\n\n\n\n")
-
-                            #print("GraphNumber: {}\n"
-                            #      "list_of_files: {}\n\n"
-                            #      "instructions: {}\n"
-                            #      "".format(changes['graph_number'], [str(file) for file in changes['list_of_files']],
-                            #                [str(change) for change in changes['instructions']]))
+                        project_analysis = static_analisys.project_analysis
+                        print_report({
+                            'files': len(project_analysis),
+                            'django_views': len([names for names in project_analysis if len(names['django_views']) > 0]),
+                            'django_models': len([names for names in project_analysis if
+                                                  len(names['django_models']) > 0]),
+                            'changes': final_changes,
+                        })
                     if final_options == 4:
                         model_analizer.graph_network.remove_isolated_nodes()
-                        model_analizer.cut_graph()
+                        model_analizer.cut_graph(options.algorithm, betweenness=betweenness, services=options.services,
+                                                 auto_k=options.auto_k)
                     if final_options == 5:
                         model_analizer.create_cuts_gelphi()
+                    if final_options == 6:
+                        # only the new profiling data is applied, only the touched cuts are recomputed
+                        from modules.ProfileDatabase import DynamicAnalysis
+                        model_names = graph_model_names(model_analizer.graph_network)
+                        new_dynamic_analysis = DynamicAnalysis(db_name, directory_path, silk_db=options.silk_db)
+                        usage_delta = resolve_models(new_dynamic_analysis.calculate_usage_delta(urls),
+                                                     static_analisys.table_models, model_names)
+                        model_analizer.graph_network.apply_usage(usage_delta)
+                        print("Services changed: {}".format(model_analizer.graph_network.dirty_cuts()))
+                        model_analizer.graph_network.repartition(options.algorithm, betweenness=betweenness)
+                        transform_analysis = resolve_models(new_dynamic_analysis.calculate_model_usage(urls),
+                                                            static_analisys.table_models, model_names)
                     if final_options == 0:
                         break
 
         except Exception as e:
             print(traceback.format_exc())
             print("error: {}".format(e))
+            if headless:
+                sys.exit(1)
+        finally:
+            pipeline.close()
 
     print("Existing")
     sys.exit(0)
@@ -1,10 +1,31 @@
+import json
+import optparse
 import os
+import shutil
+import tempfile
+import tracemalloc
 import unittest
 from unittest.mock import patch
 
-from modules.ModelParser import ModelParser
+import networkx as nx
+import pandas as pd
+from sqlalchemy import create_engine
+from networkx.algorithms.community import modularity
+
+from modules.CommunityDetection import ALGORITHMS, PartitionScorer, community_hierarchy, detect_communities, \
+    graph_fingerprint
+from modules.EdgeBetweenness import EdgeBetweenness
+from modules.GraphMaker import GraphMaker
+from modules.GraphNetwork import GraphNetwork, model_node_name
+from modules.ModelParser import ModelParser, iter_models
+from modules.PartitionSweep import sweep_partitions
+from modules.Pipeline import STAGES, Pipeline
+from modules.ProfileDatabase import DynamicAnalysis, Request, SqlQuery
+from modules.Profiler import Profiler
+from modules.SparseGraph import to_networkx
 from modules.StaticAnalysis import StaticAnalysis
-from modules.profileUtils import DynamicAnalysis
+from modules.profileUtils import aggregate_model_usage, build_dynamic_data, clear_query_cache, parse_tables_in_query, \
+    query_cache_info, request_csv_file, resolve_models, sql_queries_csv_file
 
 
 class TestMonoBreaker(unittest.TestCase):
@@ -24,6 +45,32 @@ class TestMonoBreaker(unittest.TestCase):
         self.assertNotEqual(project_info.relations_list, [])
         self.assertNotEqual(project_info.entities_list, [])
 
+    def testStreamModelFile(self):
+        with open(os.path.join(self.directory_path, 'models.json')) as data_file:
+            data = json.load(data_file)
+        expected = [(model['app_name'], model['name'], [relation['target'] for relation in model['relations']])
+                    for graph in data['graphs'] for model in graph['models']]
+        with open(os.path.join(self.directory_path, 'models.json')) as data_file:
+            streamed = [(model['app_name'], model['name'], [relation['target'] for relation in model['relations']])
+                        for model in iter_models(data_file, chunk_size=7)]
+        self.assertEqual(streamed, expected)
+
+        project_info = ModelParser(self.directory_path)
+        project_info.read_model_file()
+        streamed_graph = project_info.graph_network.main_graph
+        project_info.create_graph()
+        self.assertEqual(list(streamed_graph.nodes), list(project_info.graph_network.main_graph.nodes))
+        self.assertEqual(list(streamed_graph.edges(data=True)), list(project_info.graph_network.main_graph.edges(data=True)))
+
+    def testInternedEntities(self):
+        project_info = ModelParser(self.directory_path)
+        project_info.read_model_file()
+        category = project_info.entity_index['Category']
+        self.assertIs(project_info.relations_list[0].destination, category)
+        self.assertIs(project_info.entity(category.app_name, 'Category'), category)
+        self.assertFalse(hasattr(category, '__dict__'))
+        self.assertFalse(hasattr(project_info.relations_list[0], '__dict__'))
+
     def testCreateInitGraph(self):
         project_info = ModelParser(self.directory_path)
         project_info.read_model_file()
@@ -39,6 +86,339 @@ class TestMonoBreaker(unittest.TestCase):
         project_info.cut_graph()
         self.assertNotEqual(project_info.graph_network.list_of_graph_cuts, [])
 
+    def testCutGraphAlgorithms(self):
+        karate_club = nx.karate_club_graph()
+        for algorithm in ALGORITHMS:
+            communities = detect_communities(karate_club, algorithm, seed=1)
+            self.assertEqual(sorted(node for nodes in communities for node in nodes), list(karate_club.nodes))
+            self.assertGreater(len(communities), 1)
+        self.assertGreater(modularity(karate_club, detect_communities(karate_club, 'louvain', seed=1)), 0.35)
+
+    def testCutGraphUnknownAlgorithm(self):
+        project_info = ModelParser(self.directory_path)
+        project_info.read_model_file()
+        project_info.create_graph()
+        with self.assertRaises(Exception):
+            project_info.cut_graph(algorithm='unknown')
+
+    def testCutGraphViews(self):
+        project_info = ModelParser(self.directory_path)
+        project_info.read_model_file()
+        project_info.create_graph()
+        static_analisys = StaticAnalysis()
+        static_analisys.analyze_django_project(self.directory_path)
+        project_info.update_static_relations(static_analisys.create_static_relations())
+        graph_network = project_info.graph_network
+        graph_network.cut_graph(algorithm='louvain', seed=1)
+
+        main_graph = graph_network.main_graph
+        self.assertEqual(sum(len(cut) for cut in graph_network.list_of_graph_cuts), len(main_graph))
+        for cut, missing_files in zip(graph_network.list_of_graph_cuts, graph_network.missing_files):
+            self.assertTrue(nx.is_frozen(cut))
+            self.assertEqual(cut.number_of_edges(), main_graph.subgraph(list(cut)).number_of_edges())
+            boundary = [neighbor for node in sorted(cut) for neighbor in main_graph[node] if neighbor not in cut]
+            self.assertEqual([missing['file'] for missing in missing_files], boundary)
+        self.assertIsInstance(static_analisys.create_report(graph_network), list)
+
+    def testCommunityHierarchyCache(self):
+        graph_network = GraphNetwork()
+        graph_network.main_graph = nx.relabel_nodes(nx.karate_club_graph(), str)
+        graph_network.main_graph.add_nodes_from(['isolated_a', 'isolated_b'])
+        first_cut = [set(cut) for cut in graph_network.cut_graph()]
+        hierarchy = graph_network.community_hierarchy()
+        self.assertEqual(len(graph_network.hierarchy_cache), 1)
+        self.assertEqual([set(cut) for cut in graph_network.cut_graph(depth=1)], first_cut)
+        self.assertEqual(len(hierarchy.communities(3)), len(hierarchy.communities(1)) + 2)
+
+        graph_network.remove_isolated_nodes()
+        self.assertIs(graph_network.community_hierarchy(), hierarchy)
+        self.assertEqual(len(graph_network.hierarchy_cache), 1)
+        without_isolated = [set(cut) for cut in graph_network.cut_graph()]
+        self.assertEqual(without_isolated, [cut for cut in first_cut if not cut & {'isolated_a', 'isolated_b'}])
+        fresh_hierarchy = community_hierarchy(graph_network.main_graph)
+        for depth in range(5):
+            self.assertEqual(hierarchy.communities(depth), fresh_hierarchy.communities(depth))
+
+        # the fingerprint is computed once per graph change, the hierarchies of older graphs are dropped
+        with patch('modules.GraphNetwork.graph_fingerprint', wraps=graph_fingerprint) as fingerprint:
+            graph_network.main_graph.add_node('isolated_c')
+            graph_network.graph_changed()
+            graph_network.cut_graph()
+            graph_network.cut_graph(algorithm='louvain', seed=1)
+            graph_network.remove_isolated_nodes()
+            graph_network.cut_graph(algorithm='louvain', seed=1)
+            self.assertEqual(fingerprint.call_count, 2)
+        self.assertEqual(len(graph_network.hierarchy_cache), 2)
+        for reload in range(3):
+            graph_network.apply_usage([{'modules': ['views.View{}'.format(reload)],
+                                        'db_info': [{'model': 'app_{}'.format(reload), 'usage': 1}]}])
+            self.assertEqual(graph_network.hierarchy_cache, {})
+            graph_network.repartition(algorithm='louvain', seed=1)
+            self.assertEqual(len(graph_network.hierarchy_cache), 1)
+
+    def testServiceCount(self):
+        graph_network = GraphNetwork()
+        graph_network.main_graph = nx.relabel_nodes(nx.karate_club_graph(), str)
+        self.assertEqual(len(graph_network.cut_graph(services=4)), 4)
+
+        hierarchy = graph_network.community_hierarchy()
+        scorer = PartitionScorer(graph_network.main_graph)
+        levels = [hierarchy.communities(depth) for depth in range(6)]
+        for level in levels:
+            self.assertAlmostEqual(scorer.score(level)[0], modularity(graph_network.main_graph, level))
+        best = max(levels, key=lambda level: modularity(graph_network.main_graph, level))
+        self.assertEqual([set(cut) for cut in graph_network.cut_graph(auto_k=True, services=7)], best)
+
+        # louvain levels merge communities, the coarsest level with at least the requested services is used
+        graph_network.main_graph = nx.relabel_nodes(nx.connected_caveman_graph(30, 4), str)
+        sizes = [len(level) for depth, level in graph_network.community_hierarchy(algorithm='louvain', seed=0).iter_levels()]
+        self.assertGreater(len(sizes), 1)
+        for algorithm in ['louvain', 'leiden']:
+            levels = [frozenset(frozenset(community) for community in level) for depth, level in
+                      graph_network.community_hierarchy(algorithm=algorithm, seed=0).iter_levels()]
+            self.assertEqual(len(set(levels)), len(levels))
+        services = len(graph_network.cut_graph(algorithm='louvain', seed=0, services=10))
+        self.assertEqual(services, min(size for size in sizes if size >= 10))
+        self.assertEqual(len(graph_network.cut_graph(algorithm='louvain', seed=0, services=100)), sizes[0])
+
+        graph_maker = GraphMaker([])
+        graph_maker.G = nx.relabel_nodes(nx.karate_club_graph(), str)
+        nx.set_node_attributes(graph_maker.G, 'Model', 'type')
+        self.assertEqual(len(graph_maker.split_graph(parts=5)), 5 + 5)
+
+    def testPartitionSweep(self):
+        graph = nx.relabel_nodes(nx.karate_club_graph(), str)
+        results = sweep_partitions(graph, ['louvain', 'label_propagation', 'girvan_newman'], [0.5, 1], seeds=3, jobs=2)
+        self.assertEqual(sum(len(result['runs']) for result in results), 2 * 3 + 3 + 1)
+        self.assertEqual(results, sweep_partitions(graph, ['louvain', 'label_propagation', 'girvan_newman'], [0.5, 1],
+                                                   seeds=3))
+        for result in results:
+            self.assertAlmostEqual(result['modularity'], modularity(graph, result['communities']))
+        self.assertTrue(results[0]['pareto'])
+        front = [result for result in results if result['pareto']]
+        for result in results:
+            if not result['pareto']:
+                self.assertTrue(any(best['modularity'] >= result['modularity'] and
+                                    best['cut_weight'] <= result['cut_weight'] and
+                                    best['balance'] >= result['balance'] for best in front))
+
+        graph_network = GraphNetwork()
+        graph_network.main_graph = graph
+        louvain_results = graph_network.sweep(['louvain'], [1], seeds=2)
+        self.assertEqual([sorted(cut) for cut in graph_network.list_of_graph_cuts], louvain_results[0]['communities'])
+
+    def testParallelEdgeBetweenness(self):
+        graph = nx.karate_club_graph()
+        expected = nx.edge_betweenness_centrality(graph, normalized=False)
+        with EdgeBetweenness(processes=2) as betweenness:
+            parallel = betweenness.betweenness(graph)
+            # the workers keep their copy of the graph and only apply the removed edges
+            shrinking = graph.copy()
+            for edge in list(shrinking.edges())[:5]:
+                shrinking.remove_edge(*edge)
+                removed = betweenness.betweenness(shrinking)
+                expected_removed = nx.edge_betweenness_centrality(shrinking, normalized=False)
+                self.assertEqual(set(removed), set(expected_removed))
+                for removed_edge, value in expected_removed.items():
+                    self.assertAlmostEqual(removed[removed_edge], value)
+            shrinking.add_edge(*edge)
+            self.assertAlmostEqual(sum(betweenness.betweenness(shrinking).values()),
+                                   sum(nx.edge_betweenness_centrality(shrinking, normalized=False).values()))
+            self.assertEqual(betweenness(graph), max(parallel, key=parallel.get))
+        self.assertEqual(betweenness.workers, [])
+        self.assertEqual(set(parallel), set(graph.edges()))
+        for edge, value in expected.items():
+            self.assertAlmostEqual(parallel[edge], value)
+
+        sampler = EdgeBetweenness(k=10, seed=1)
+        sampled = sampler.betweenness(graph)
+        self.assertEqual(set(sampled), set(graph.edges()))
+        self.assertGreater(sum(sampled.values()), 0)
+        sampler.betweenness(nx.path_graph(20))
+        self.assertEqual(sampler.betweenness(graph), sampled)
+        self.assertEqual(EdgeBetweenness(k=10, seed=1).betweenness(graph), sampled)
+
+        graph_network = GraphNetwork()
+        graph_network.main_graph = graph
+        exact_cut = [set(cut) for cut in graph_network.cut_graph(betweenness=EdgeBetweenness())]
+        self.assertEqual(exact_cut, detect_communities(graph))
+        graph_network.cut_graph()
+        self.assertEqual(len(graph_network.hierarchy_cache), 1)
+        graph_network.cut_graph(betweenness=EdgeBetweenness(k=10, seed=1))
+        self.assertEqual(len(graph_network.hierarchy_cache), 2)
+        graph_network.cut_graph(betweenness=EdgeBetweenness(k=10, seed=2))
+        self.assertEqual(len(graph_network.hierarchy_cache), 3)
+
+    def testSparseGraphBackend(self):
+        networks = [GraphNetwork('networkx'), GraphNetwork('sparse')]
+        karate = nx.relabel_nodes(nx.karate_club_graph(), lambda node: 'Model{}'.format(node))
+        analysis = [{'modules': ['app.views.listing'], 'db_info': [{'model': 'app_model0', 'usage': 4},
+                                                                   {'model': 'app_model33', 'usage': 2}]},
+                    {'modules': ['app.views.detail'], 'db_info': [{'model': 'app_model0', 'usage': 8}]}]
+        for graph_network in networks:
+            graph_network.main_graph.add_nodes_from(list(karate.nodes) + ['Isolated'])
+            for origin, destination in karate.edges():
+                graph_network.main_graph.add_edge(origin, destination, weight=1)
+            graph_network.main_graph.add_edge('Model0', 'Model1', weight=3)
+            # an import that is never referenced has usage 0, the edge still connects the nodes
+            graph_network.main_graph.add_edge('Unused', 'Model33', weight=0)
+            graph_network.main_graph.add_edge('Unused', 'Unused', weight=0)
+            graph_network.update(analysis)
+            graph_network.remove_isolated_nodes()
+
+        networkx_graph, sparse_graph = networks[0].main_graph, networks[1].main_graph
+        self.assertNotIn('Isolated', sparse_graph)
+        self.assertTrue(sparse_graph.has_edge('Unused', 'Model33'))
+        self.assertEqual(sparse_graph.get_edge_data('Unused', 'Model33'), {'weight': 0})
+        self.assertEqual(dict(sparse_graph.degree()), dict(networkx_graph.degree()))
+        self.assertEqual(sparse_graph.nodes, list(networkx_graph.nodes))
+        self.assertEqual({frozenset(edge[:2]): edge[2]['weight'] for edge in sparse_graph.edges(data=True)},
+                         {frozenset(edge[:2]): edge[2]['weight'] for edge in networkx_graph.edges(data=True)})
+        self.assertEqual(sparse_graph.get_edge_data('Model0', 'Model1'), {'weight': 3})
+        # usage is scaled by the busiest pair, detail reads app_model0 8 times
+        self.assertEqual(sparse_graph.get_edge_data('Model0', 'listing'), {'weight': 1 + 4 / 8})
+
+        exported = to_networkx(sparse_graph)
+        self.assertTrue(nx.is_isomorphic(exported, networkx_graph, edge_match=lambda a, b: a == b))
+        self.assertEqual(exported.nodes['listing'], {'type': 'View'})
+        for algorithm in ['girvan_newman', 'label_propagation']:
+            self.assertEqual([set(cut) for cut in networks[1].cut_graph(algorithm=algorithm, seed=7)],
+                             [set(cut) for cut in networks[0].cut_graph(algorithm=algorithm, seed=7)])
+            self.assertEqual(networks[1].missing_files, networks[0].missing_files)
+
+    def testUpdateStaticRelations(self):
+        project_info = ModelParser(self.directory_path)
+        project_info.read_model_file()
+        project_info.create_graph()
+        project_info.update_static_relations({'catalogue.views': [{'name': 'Catalogue', 'usage': 2},
+                                                                  {'name': 'Missing', 'usage': 1}],
+                                              'Catalogue': [{'name': 'Category', 'usage': 3}]})
+        main_graph = project_info.graph_network.main_graph
+        self.assertEqual(main_graph['Catalogue']['catalogue.views'], {'weight': 2})
+        self.assertEqual(main_graph['Category']['Catalogue'], {'weight': 3})
+        self.assertNotIn('Missing', main_graph)
+        self.assertIs(project_info.entity_index['catalogue.views'], project_info.entities_list[-2])
+        self.assertEqual(len(project_info.relations_list), 3)
+
+    def testPipelineStages(self):
+        options = optparse.Values({'graph_backend': 'networkx', 'cache_dir': None, 'jobs': 1, 'silk_db': None,
+                                   'rebuild_db': False, 'algorithm': 'girvan_newman', 'services': None,
+                                   'auto_k': False, 'betweenness_jobs': 1, 'betweenness_samples': None,
+                                   'betweenness_seed': 0, 'sweep': False})
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_path = os.path.join(temp_dir, 'catalogue')
+            shutil.copytree(self.directory_path, project_path)
+            db_name = os.path.join(temp_dir, 'Test.db')
+            artifact_dir = os.path.join(temp_dir, 'stages')
+
+            pipeline = Pipeline(options, project_path, db_name, artifact_dir)
+            report = pipeline.run()
+            self.assertEqual(set(pipeline.computed), set(STAGES))
+            # the graph stage does not add its edges to the models result
+            models = ModelParser(project_path)
+            models.read_model_file()
+            self.assertEqual(list(pipeline.get('models').graph_network.main_graph.edges(data=True)),
+                             list(models.graph_network.main_graph.edges(data=True)))
+            self.assertEqual(len(pipeline.get('models').relations_list), len(models.relations_list))
+
+            pipeline = Pipeline(options, project_path, db_name, artifact_dir)
+            self.assertEqual(pipeline.run(), report)
+            self.assertEqual(pipeline.computed, [])
+
+            os.utime(os.path.join(project_path, 'urls.txt'), ns=(0, 0))
+            pipeline = Pipeline(options, project_path, db_name, artifact_dir)
+            self.assertEqual(pipeline.run(), report)
+            self.assertEqual(set(pipeline.computed), set(STAGES) - {'models'})
+            self.assertEqual(pipeline.reused, ['models'])
+
+            options.algorithm = 'louvain'
+            pipeline = Pipeline(options, project_path, db_name, artifact_dir)
+            pipeline.run()
+            self.assertEqual(set(pipeline.computed), {'cuts', 'report'})
+            self.assertEqual(set(pipeline.reused), {'graph', 'static'})
+
+            options.betweenness_samples = 10
+            sampled_key = Pipeline(options, project_path, db_name).key('cuts')
+            options.betweenness_seed = 1
+            self.assertNotEqual(Pipeline(options, project_path, db_name).key('cuts'), sampled_key)
+            options.betweenness_samples = None
+
+            options.algorithm = 'girvan_newman'
+            options.betweenness_jobs = 2
+            pipeline = Pipeline(options, project_path, db_name)
+            self.assertEqual(pipeline.run(), report)
+            self.assertEqual(pipeline.betweenness.workers, [])
+
+    def testStageProfile(self):
+        options = optparse.Values({'graph_backend': 'networkx', 'cache_dir': None, 'jobs': 1, 'silk_db': None,
+                                   'rebuild_db': False, 'algorithm': 'louvain', 'services': None,
+                                   'auto_k': False, 'betweenness_jobs': 1, 'betweenness_samples': None,
+                                   'betweenness_seed': 0, 'sweep': False})
+        with tempfile.TemporaryDirectory() as temp_dir:
+            profiler = Profiler(cprofile=True)
+            pipeline = Pipeline(options, self.directory_path, os.path.join(temp_dir, 'Test.db'), profiler=profiler)
+            pipeline.run()
+            profile_path = os.path.join(temp_dir, 'profile.json')
+            profiler.write(profile_path)
+            with open(profile_path) as profile_file:
+                profile = json.load(profile_file)
+
+            # the query cache outlives the pipeline, a second run in the same process counts only its own queries
+            second_profiler = Profiler(memory=False)
+            Pipeline(options, self.directory_path, os.path.join(temp_dir, 'Second.db'), profiler=second_profiler).run()
+
+        self.assertEqual(set(profile['stages']), set(STAGES))
+        graph_stage = profile['stages']['graph']
+        self.assertGreaterEqual(graph_stage['seconds'], graph_stage['self_seconds'])
+        if hasattr(tracemalloc, 'reset_peak'):
+            self.assertGreaterEqual(graph_stage['peak_memory'], graph_stage['self_peak_memory'])
+        self.assertFalse(graph_stage['cached'])
+        self.assertTrue(graph_stage['functions'])
+        self.assertEqual(profile['counters']['static.files_parsed'], len(pipeline.static_analysis().project_analysis))
+        self.assertEqual(profile['counters']['graph.nodes'], pipeline.model_parser().graph_network.main_graph.number_of_nodes())
+        self.assertEqual(profile['counters']['dynamic.queries_parsed'], 36)
+        self.assertEqual(second_profiler.counters['dynamic.queries_parsed'], 36)
+        self.assertEqual(second_profiler.counters['dynamic.query_cache_misses'], 0)
+
+    @unittest.skipUnless(hasattr(tracemalloc, 'reset_peak'), "stage peaks need tracemalloc.reset_peak")
+    def testStagePeakMemory(self):
+        # memory kept from an earlier stage or by a stage it ran does not count towards the peak of a stage
+        profiler = Profiler()
+        with profiler.stage('kept'):
+            kept = bytearray(8 * 1024 * 1024)
+        with profiler.stage('outer'):
+            with profiler.stage('inner'):
+                inner = bytearray(4 * 1024 * 1024)
+            outer = bytearray(1024 * 1024)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            profiler.write(os.path.join(temp_dir, 'profile.json'))
+        self.assertGreaterEqual(profiler.stages['kept']['self_peak_memory'], len(kept))
+        self.assertGreaterEqual(profiler.stages['outer']['self_peak_memory'], len(outer))
+        self.assertLess(profiler.stages['outer']['self_peak_memory'], len(inner))
+        self.assertGreaterEqual(profiler.stages['outer']['peak_memory'], len(inner) + len(outer))
+        self.assertLess(profiler.stages['outer']['peak_memory'], len(kept))
+
+    def testStageProfileWithoutResetPeak(self):
+        # tracemalloc.reset_peak only exists from python 3.9
+        reset_peak = getattr(tracemalloc, 'reset_peak', None)
+        if reset_peak:
+            del tracemalloc.reset_peak
+        try:
+            profiler = Profiler()
+            with profiler.stage('freed'):
+                bytearray(8 * 1024 * 1024)
+            with profiler.stage('idle'):
+                pass
+            with tempfile.TemporaryDirectory() as temp_dir:
+                profiler.write(os.path.join(temp_dir, 'profile.json'))
+        finally:
+            if reset_peak:
+                tracemalloc.reset_peak = reset_peak
+        for stage in ['freed', 'idle']:
+            self.assertIsNone(profiler.stages[stage]['peak_memory'])
+            self.assertIsNone(profiler.stages[stage]['self_peak_memory'])
+            self.assertIn('memory_delta', profiler.stages[stage])
+
     def testShowGraph(self):
         project_info = ModelParser(self.directory_path)
         project_info.read_model_file()
@@ -55,13 +435,226 @@ class TestMonoBreaker(unittest.TestCase):
         self.assertIsInstance(urls, list)
         self.assertIsInstance(urls[0], dict)
 
+    def testParallelStaticAnalysis(self):
+        serial = StaticAnalysis()
+        serial.analyze_django_project(self.directory_path)
+        parallel = StaticAnalysis()
+        parallel.analyze_django_project(self.directory_path, jobs=2)
+        self.assertEqual(serial.project_analysis, parallel.project_analysis)
+        self.assertEqual(serial.create_static_relations(), parallel.create_static_relations())
+        self.assertIn('CatalogueViewSet', serial.create_static_relations())
+
+    def testStaticAnalysisCache(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_path = os.path.join(temp_dir, 'catalogue')
+            shutil.copytree(os.path.join(self.directory_path, 'catalogue'), project_path)
+            cache_dir = os.path.join(temp_dir, 'cache')
+
+            cold = StaticAnalysis(cache_dir=cache_dir)
+            cold.analyze_django_project(project_path)
+            self.assertEqual(cold.cache.hits, 0)
+
+            warm = StaticAnalysis(cache_dir=cache_dir)
+            warm.analyze_django_project(project_path)
+            self.assertEqual(warm.cache.misses, 0)
+            self.assertEqual(warm.project_analysis, cold.project_analysis)
+
+            with open(os.path.join(project_path, 'admin.py'), 'a') as admin_file:
+                admin_file.write('\nclass Extra:\n    pass\n')
+            changed = StaticAnalysis(cache_dir=cache_dir)
+            changed.analyze_django_project(project_path)
+            self.assertEqual(changed.cache.misses, 1)
+            self.assertEqual(changed.cache.hits, cold.cache.misses - 1)
+
+    def testStaticRelationsIndex(self):
+        static_analisys = StaticAnalysis()
+        view_import = {'module': 'app.models', 'name': 'Catalogue', 'asname': None, 'is_model': True, 'usage': 2}
+        static_analisys.project_analysis = [
+            {'classes': ['Catalogue'], 'imports': [], 'django_views': []},
+            {'classes': ['Catalogue', 'Category'], 'imports': [], 'django_views': []},
+            {'classes': ['CatalogueViewSet'], 'imports': [view_import], 'django_views': [{'name': 'CatalogueViewSet'}]},
+            {'classes': [], 'imports': [view_import], 'django_views': []},
+        ]
+        relations = static_analisys.create_static_relations()
+        self.assertEqual(dict(relations), {'CatalogueViewSet': [{'name': 'Catalogue', 'usage': 2},
+                                                                {'name': 'Catalogue', 'usage': 2}]})
+
+    def testResolveModels(self):
+        static_analisys = StaticAnalysis()
+        static_analisys.analyze_django_project(self.directory_path)
+        self.assertEqual(static_analisys.table_models, {'catalogue': 'Catalogue', 'category': 'Category'})
+        dynamic_data = [{'db_info': [{'model': '"CATALOGUE"'}, {'model': '"category"'}, {'model': '"auth_user"'}]}]
+        resolve_models(dynamic_data, static_analisys.table_models, {'catalogue'})
+        self.assertEqual([info['model'] for info in dynamic_data[0]['db_info']], ['Catalogue', '"category"', '"auth_user"'])
+        resolve_models(dynamic_data, static_analisys.table_models)
+        self.assertEqual([info['model'] for info in dynamic_data[0]['db_info']], ['Catalogue', 'Category', '"auth_user"'])
+
     def testDynamicAnalysis(self):
-        db_name = 'Test.db'
         static_analisys = StaticAnalysis()
         static_analisys.analyze_django_project(self.directory_path)
         urls = static_analisys.parse_url_file()
-        dynamic_analysis = DynamicAnalysis(db_name, self.directory_path).calculate_model_usage(urls)
-        self.assertNotEqual(dynamic_analysis, [])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dynamic_analysis = DynamicAnalysis(os.path.join(temp_dir, 'Test.db'), self.directory_path)
+            dynamic_data = dynamic_analysis.calculate_model_usage(urls)
+            dynamic_analysis.engine.dispose()
+        self.assertNotEqual(dynamic_data, [])
+
+    def testAnaliseQueries(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dynamic_analysis = DynamicAnalysis(os.path.join(temp_dir, 'Test.db'), self.directory_path)
+            query_analysis = dynamic_analysis.analise_queries()
+            dynamic_analysis.engine.dispose()
+        self.assertEqual(len(query_analysis), 10)
+        catalogue_list = [analysis for analysis in query_analysis if analysis['view_name'] == 'Catalogue-list']
+        self.assertEqual(len(catalogue_list), 9)
+        self.assertIn('"CATALOGUE"', catalogue_list[0]['tables'])
+        self.assertEqual(set(catalogue_list[0]['type']), {'SELECT'})
+
+    def testChunkedCsvImport(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dynamic_analysis = DynamicAnalysis(os.path.join(temp_dir, 'Test.db'), self.directory_path, chunk_size=5)
+            self.assertEqual(dynamic_analysis.session.query(Request).count(), 14)
+            self.assertEqual(dynamic_analysis.session.query(SqlQuery).count(), 36)
+            self.assertEqual(dynamic_analysis.session.query(SqlQuery).filter(SqlQuery.traceback.isnot(None)).count(), 0)
+            dynamic_analysis.session.close()
+            dynamic_analysis.engine.dispose()
+
+            dynamic_analysis = DynamicAnalysis(os.path.join(temp_dir, 'Test.db'), self.directory_path,
+                                               import_traceback=True, rebuild=True)
+            self.assertEqual(dynamic_analysis.session.query(SqlQuery).filter(SqlQuery.traceback.isnot(None)).count(), 36)
+            dynamic_analysis.session.close()
+            dynamic_analysis.engine.dispose()
+
+    def testShuffledCsvImport(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            requests = pd.read_csv(self.directory_path + request_csv_file)
+            sql_queries = pd.read_csv(self.directory_path + sql_queries_csv_file)
+            requests.sample(frac=1, random_state=1).to_csv(temp_dir + request_csv_file, index=False)
+            sql_queries.iloc[::-1].to_csv(temp_dir + sql_queries_csv_file, index=False)
+            dynamic_analysis = DynamicAnalysis(os.path.join(temp_dir, 'Test.db'), temp_dir, chunk_size=5)
+            self.assertEqual(dynamic_analysis.session.query(Request).count(), 14)
+            self.assertEqual(dynamic_analysis.session.query(SqlQuery).count(), 36)
+            dynamic_analysis.session.close()
+            dynamic_analysis.engine.dispose()
+
+    def testIncrementalDynamicAnalysis(self):
+        static_analisys = StaticAnalysis()
+        static_analisys.analyze_django_project(self.directory_path)
+        urls = static_analisys.parse_url_file()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            sql_queries = pd.read_csv(self.directory_path + sql_queries_csv_file)
+            sql_queries.head(20).to_csv(temp_dir + sql_queries_csv_file, index=False)
+            shutil.copy(self.directory_path + request_csv_file, temp_dir + request_csv_file)
+            dynamic_analysis = DynamicAnalysis(os.path.join(temp_dir, 'Test.db'), temp_dir)
+            dynamic_analysis.calculate_model_usage(urls)
+            dynamic_analysis.engine.dispose()
+
+            shutil.copy(self.directory_path + sql_queries_csv_file, temp_dir + sql_queries_csv_file)
+            dynamic_analysis = DynamicAnalysis(os.path.join(temp_dir, 'Test.db'), temp_dir)
+            incremental = dynamic_analysis.calculate_model_usage(urls)
+            self.assertEqual(dynamic_analysis.session.query(SqlQuery).count(), 36)
+            self.assertEqual(sum(len(analysis['type']) for analysis in dynamic_analysis.query_analysis), 16)
+            dynamic_analysis.engine.dispose()
+
+            dynamic_analysis = DynamicAnalysis(os.path.join(temp_dir, 'Test.db'), temp_dir, rebuild=True)
+            rebuilt = dynamic_analysis.calculate_model_usage(urls)
+            dynamic_analysis.engine.dispose()
+        self.assertEqual(sorted(incremental, key=lambda view: view['view_name']),
+                         sorted(rebuilt, key=lambda view: view['view_name']))
+
+    def testUsageDelta(self):
+        static_analisys = StaticAnalysis()
+        static_analisys.analyze_django_project(self.directory_path)
+        urls = static_analisys.parse_url_file()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            sql_queries = pd.read_csv(self.directory_path + sql_queries_csv_file)
+            sql_queries.head(20).to_csv(temp_dir + sql_queries_csv_file, index=False)
+            shutil.copy(self.directory_path + request_csv_file, temp_dir + request_csv_file)
+            dynamic_analysis = DynamicAnalysis(os.path.join(temp_dir, 'Test.db'), temp_dir)
+            first = dynamic_analysis.calculate_usage_delta(urls)
+            dynamic_analysis.engine.dispose()
+
+            shutil.copy(self.directory_path + sql_queries_csv_file, temp_dir + sql_queries_csv_file)
+            dynamic_analysis = DynamicAnalysis(os.path.join(temp_dir, 'Test.db'), temp_dir)
+            second = dynamic_analysis.calculate_usage_delta(urls)
+            full = dynamic_analysis.calculate_model_usage(urls)
+            dynamic_analysis.engine.dispose()
+
+        networks = [GraphNetwork(), GraphNetwork()]
+        for graph_network in networks:
+            graph_network.main_graph.add_nodes_from(set(model_node_name(info['model'])
+                                                        for view in full for info in view['db_info']))
+        networks[0].apply_usage(first, factor=1)
+        networks[0].apply_usage(second, factor=1)
+        networks[1].apply_usage(full, factor=1)
+        self.assertEqual(sorted(networks[0].main_graph.edges(data='weight')),
+                         sorted(networks[1].main_graph.edges(data='weight')))
+
+        graph_network = GraphNetwork()
+        graph_network.main_graph = nx.relabel_nodes(nx.karate_club_graph(), lambda node: 'Model{}'.format(node))
+        graph_network.cut_graph(algorithm='louvain', seed=1)
+        cuts = [set(cut) for cut in graph_network.list_of_graph_cuts]
+        graph_network.apply_usage([{'modules': ['app.views.listing'], 'db_info': [{'model': 'app_model0', 'usage': 5}]}],
+                                  factor=1)
+        self.assertEqual(graph_network.main_graph['Model0']['listing']['weight'], 6)
+        self.assertEqual(graph_network.dirty_cuts(), [graph_network.cut_labels['Model0']])
+        repartitioned = [set(cut) for cut in graph_network.repartition(algorithm='louvain', seed=1)]
+        self.assertEqual(graph_network.dirty_nodes, set())
+        self.assertEqual(set().union(*repartitioned), set(graph_network.main_graph))
+        clean_cuts = [cut for cut in cuts if 'Model0' not in cut]
+        self.assertTrue(all(cut in repartitioned for cut in clean_cuts))
+
+    def testSilkDatabase(self):
+        static_analisys = StaticAnalysis()
+        static_analisys.analyze_django_project(self.directory_path)
+        urls = static_analisys.parse_url_file()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            silk_db = 'sqlite:///' + os.path.join(temp_dir, 'silk.db')
+            silk_engine = create_engine(silk_db)
+            pd.read_csv(self.directory_path + request_csv_file).to_sql('silk_request', silk_engine, index=False)
+            pd.read_csv(self.directory_path + sql_queries_csv_file).to_sql('silk_sqlquery', silk_engine, index=False)
+            silk_engine.dispose()
+
+            dynamic_analysis = DynamicAnalysis(os.path.join(temp_dir, 'Test.db'), None, silk_db=silk_db)
+            from_silk = dynamic_analysis.calculate_model_usage(urls)
+            self.assertEqual(dynamic_analysis.session.query(SqlQuery).count(), 0)
+            dynamic_analysis.engine.dispose()
+            dynamic_analysis.source_engine.dispose()
+
+            dynamic_analysis = DynamicAnalysis(os.path.join(temp_dir, 'Csv.db'), self.directory_path)
+            from_csv = dynamic_analysis.calculate_model_usage(urls)
+            dynamic_analysis.engine.dispose()
+        self.assertEqual(sorted(from_silk, key=lambda view: view['view_name']),
+                         sorted(from_csv, key=lambda view: view['view_name']))
+
+    def testBuildDynamicData(self):
+        query_analysis = [
+            {'path': '/api/a/', 'view_name': 'A-list', 'tables': ['"A"', '"B"', '"A"'], 'type': ['SELECT', 'SELECT']},
+            {'path': '/api/a/', 'view_name': 'A-list', 'tables': ['"A_b"'], 'type': ['UPDATE']},
+            {'path': '/api/b/', 'view_name': 'B-list', 'tables': [], 'type': []},
+        ]
+        urls = [{'name': '/api/a/', 'module': 'app.views.AViewSet', 'functionCall': 'A-list'},
+                {'name': '/api/b/', 'module': 'B-list', 'functionCall': ''}]
+        view_names, usage, usage_types = aggregate_model_usage(query_analysis)
+        dynamic_data = sorted(build_dynamic_data(view_names, usage, usage_types, urls), key=lambda view: view['view_name'])
+        self.assertEqual(dynamic_data, [{
+            'view_name': 'A-list',
+            'modules': ['app.views.AViewSet'],
+            'main_module': 'app.views.AViewSet',
+            'db_info': [{'model': '"A"', 'usage': 2, 'model_type': {'SELECT'}},
+                        {'model': '"B"', 'usage': 1, 'model_type': {'SELECT'}},
+                        {'model': '"A_b"', 'usage': 1, 'model_type': {'UPDATE'}}]
+        }, {'view_name': 'B-list', 'modules': ['B-list'], 'main_module': 'B-list', 'db_info': []}])
+
+    def testQueryFingerprintCache(self):
+        clear_query_cache()
+        first = parse_tables_in_query('SELECT "CATALOGUE"."id" FROM "CATALOGUE" WHERE "CATALOGUE"."id" IN (1, 2, 3)')
+        second = parse_tables_in_query("SELECT \"CATALOGUE\".\"id\" FROM \"CATALOGUE\" WHERE \"CATALOGUE\".\"id\" IN (7)")
+        self.assertEqual(first, {'tables': {'"CATALOGUE"'}, 'query_type': 'SELECT'})
+        self.assertEqual(first, second)
+        self.assertEqual(query_cache_info()['misses'], 1)
+        self.assertEqual(query_cache_info()['hits'], 1)
+        self.assertEqual(query_cache_info()['hit_rate'], 0.5)
 
 
 if __name__ == "__main__":